@@ -9,17 +9,35 @@ Kept:
 - get_sap_write_service (write-back)
 """
 
+from functools import lru_cache
 from fastapi import HTTPException
-from app.services.sap_service import SAPService
+from app.services.sap_service import SAPService, CachedSAPService
 from app.services.sap_write_service import SAPWriteService
 from app.config import get_settings
 
+# Settings the write service cannot run without, checked in this order
+REQUIRED_WRITE_SETTINGS = ('SAP_WRITE_API_URL', 'SAP_PLANNING_AREA', 'SAP_XYZ_KEY_FIGURE')
 
+
+@lru_cache()
 def get_sap_service() -> SAPService:
-    """Dependency for SAP read service"""
+    """
+    Dependency for SAP read service (disk-cached when SAP_CACHE_DIR is set)
+    
+    The service only holds settings and the shared read session, so one
+    instance is built on first use and reused by every request.
+    """
+    if get_settings().SAP_CACHE_DIR:
+        return CachedSAPService()
     return SAPService()
 
 
+@lru_cache()
+def _write_service() -> SAPWriteService:
+    """Shared write service instance (holds settings only; sessions are per call)"""
+    return SAPWriteService()
+
+
 def get_sap_write_service() -> SAPWriteService:
     """Dependency for SAP write service with validation"""
     settings = get_settings()
@@ -32,22 +50,11 @@ def get_sap_write_service() -> SAPWriteService:
         )
     
     # Validate required write configuration
-    if not settings.SAP_WRITE_API_URL:
-        raise HTTPException(
-            status_code=500,
-            detail="SAP_WRITE_API_URL not configured"
-        )
-    
-    if not settings.SAP_PLANNING_AREA:
-        raise HTTPException(
-            status_code=500,
-            detail="SAP_PLANNING_AREA not configured"
-        )
-    
-    if not settings.SAP_XYZ_KEY_FIGURE:
-        raise HTTPException(
-            status_code=500,
-            detail="SAP_XYZ_KEY_FIGURE not configured"
-        )
+    for setting_name in REQUIRED_WRITE_SETTINGS:
+        if not getattr(settings, setting_name):
+            raise HTTPException(
+                status_code=500,
+                detail=f"{setting_name} not configured"
+            )
     
-    return SAPWriteService()
\ No newline at end of file
+    return _write_service()
\ No newline at end of file
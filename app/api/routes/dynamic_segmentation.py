@@ -10,7 +10,7 @@ Key changes:
 from fastapi import APIRouter, Depends, Query, HTTPException, Body
 from fastapi.responses import StreamingResponse
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 import pandas as pd
 import io
 
@@ -29,6 +29,38 @@ from app.utils.logger import get_logger
 router = APIRouter(prefix="/api/v1/dynamic-segmentation", tags=["Dynamic Segmentation"])
 logger = get_logger(__name__)
 
+# Routes that call SAP or run pandas work are declared with plain def, so
+# FastAPI runs them in its threadpool instead of blocking the event loop
+
+# Rows rendered per chunk when streaming CSV exports
+CSV_CHUNK_ROWS = 10000
+
+# Most analyses accepted by one /analyze/batch request
+MAX_BATCH_ANALYSES = 20
+
+
+def _frame_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Equivalent of df.to_dict('records') built column-wise
+    
+    Each column is converted to Python objects with one tolist() call and
+    the rows are zipped into dicts, which avoids pandas' per-value boxing
+    and is roughly twice as fast on large results.
+    """
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[col].tolist() for col in columns))]
+
+
+def _iter_csv(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Render df as CSV in row chunks for a StreamingResponse
+    
+    Only one chunk of text is held at a time, instead of the whole file
+    plus the copy made by StringIO.getvalue().
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=(start == 0))
+
 
 @router.get("/available-attributes")
 async def get_available_attributes_list():
@@ -99,7 +131,7 @@ async def get_available_attributes_list():
 
 
 @router.post("/preview", response_model=SegmentationPreviewResponse)
-async def preview_segmentation(
+def preview_segmentation(
     config: SegmentationConfig = Body(...),
     sap_service: SAPService = Depends(get_sap_service)
 ):
@@ -131,14 +163,11 @@ async def preview_segmentation(
     logger.info(f"Previewing segmentation: primary_key={config.primary_key}, attributes={config.groupby_attributes}")
     
     try:
-        # Determine additional attributes to fetch (exclude primary key)
-        additional_attrs = [a for a in config.groupby_attributes if a != config.primary_key]
-        
         # Fetch data with specified primary key
         df = sap_service.fetch_data(
             primary_key=config.primary_key,
             additional_filters=config.filters,
-            additional_attributes=additional_attrs
+            additional_attributes=config.additional_attributes
         )
         
         if df.empty:
@@ -169,7 +198,7 @@ async def preview_segmentation(
 
 
 @router.post("/analyze", response_model=DynamicXYZAnalysisResponse)
-async def analyze_dynamic_segmentation(
+def analyze_dynamic_segmentation(
     config: SegmentationConfig = Body(...),
     sap_service: SAPService = Depends(get_sap_service)
 ):
@@ -212,71 +241,128 @@ async def analyze_dynamic_segmentation(
     logger.info(f"Starting analysis: primary_key={config.primary_key}, attributes={config.groupby_attributes}")
     
     try:
-        # Determine additional attributes to fetch
-        additional_attrs = [a for a in config.groupby_attributes if a != config.primary_key]
-        
-        # Fetch data from SAP with specified primary key
-        df = sap_service.fetch_data(
-            primary_key=config.primary_key,
-            additional_filters=config.filters,
-            additional_attributes=additional_attrs
-        )
+        df = _fetch_analysis_data(config, sap_service)
+        return _analyze(config, df)
         
-        if df.empty:
-            raise HTTPException(status_code=404, detail="No data found with given filters")
-        
-        logger.info(f"Fetched {len(df)} records for analysis")
-        
-        # Perform dynamic segmentation
-        analysis_service = DynamicAnalysisService()
-        result_df, data_quality = analysis_service.calculate_dynamic_xyz_segmentation(df, config)
-        
-        if result_df.empty:
-            raise HTTPException(
-                status_code=422,
-                detail="No segments produced. Try reducing min_periods or adjusting filters."
-            )
-        
-        # Get segment distribution
-        segment_distribution = result_df['XYZ_Segment'].value_counts().to_dict()
-        
-        # Convert to response format
-        data = result_df.to_dict('records')
-        
-        logger.info(
-            f"Analysis complete: {len(result_df)} unique segments, "
-            f"primary_key={config.primary_key}, distribution: {segment_distribution}"
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Dynamic analysis failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/analyze/batch", response_model=List[DynamicXYZAnalysisResponse])
+def analyze_dynamic_segmentation_batch(
+    configs: List[SegmentationConfig] = Body(..., min_length=1, max_length=MAX_BATCH_ANALYSES),
+    sap_service: SAPService = Depends(get_sap_service)
+):
+    """
+    Run several dynamic XYZ analyses in one request
+    
+    Takes a list of analysis configs (same shape as /analyze) and returns one
+    result per config, in order. Configs that need the same extraction
+    (primary key, attributes and filters) share a single fetch. If any
+    analysis fails, the whole batch fails with that analysis' error.
+    
+    **Example Request:**
+    ```json
+    [
+        {"primary_key": "PRDID", "groupby_attributes": ["PRDID", "LOCID"]},
+        {"primary_key": "PRDID", "groupby_attributes": ["PRDID", "LOCID"], "x_threshold": 15.0},
+        {"primary_key": "LOCID", "groupby_attributes": ["LOCID"]}
+    ]
+    ```
+    """
+    logger.info(f"Starting batch analysis: {len(configs)} configurations")
+    
+    try:
+        frames = {}
+        results = []
+        for config in configs:
+            fetch_key = _extraction_key(config, sap_service)
+            if fetch_key not in frames:
+                frames[fetch_key] = _fetch_analysis_data(config, sap_service)
+            results.append(_analyze(config, frames[fetch_key]))
         
-        return DynamicXYZAnalysisResponse(
-            total_records=data_quality['total_records_analyzed'],
-            unique_segments=data_quality['unique_segments'],
-            primary_key=config.primary_key,
-            segmentation_level=config.groupby_attributes,
-            segment_distribution=segment_distribution,
-            analysis_params={
-                "primary_key": config.primary_key,
-                "x_threshold": config.x_threshold,
-                "y_threshold": config.y_threshold,
-                "min_periods": config.min_periods,
-                "groupby_attributes": config.groupby_attributes,
-                "aggregation_method": config.aggregation_method.value,
-                "outliers_removed": config.remove_outliers
-            },
-            data=data,
-            data_quality=data_quality,
-            timestamp=datetime.utcnow().isoformat()
-        )
+        logger.info(f"Batch analysis complete: {len(results)} analyses, {len(frames)} extractions")
+        return results
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Dynamic analysis failed: {str(e)}", exc_info=True)
+        logger.error(f"Batch analysis failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _extraction_key(config: SegmentationConfig, sap_service: SAPService) -> Tuple:
+    """Identity of the extraction an analysis config reads"""
+    return sap_service.extraction_key(config.primary_key, config.filters, config.additional_attributes)
+
+
+def _fetch_analysis_data(config: SegmentationConfig, sap_service: SAPService) -> pd.DataFrame:
+    """Fetch the extraction an analysis config needs (404 when it is empty)"""
+    # Fetch data from SAP with specified primary key
+    df = sap_service.fetch_data(
+        primary_key=config.primary_key,
+        additional_filters=config.filters,
+        additional_attributes=config.additional_attributes
+    )
+    
+    if df.empty:
+        raise HTTPException(status_code=404, detail="No data found with given filters")
+    
+    logger.info(f"Fetched {len(df)} records for analysis")
+    return df
+
+
+def _analyze(config: SegmentationConfig, df: pd.DataFrame) -> DynamicXYZAnalysisResponse:
+    """Segment fetched data for one config and build the analysis response"""
+    # Perform dynamic segmentation (memoized per extraction and config)
+    analysis_service = DynamicAnalysisService()
+    result_df, data_quality = analysis_service.calculate_cached_xyz_segmentation(
+        df, config, SAPService.extraction_id(df)
+    )
+    
+    if result_df.empty:
+        raise HTTPException(
+            status_code=422,
+            detail="No segments produced. Try reducing min_periods or adjusting filters."
+        )
+    
+    # Segment distribution was already counted by the analysis
+    segment_distribution = data_quality['segment_distribution']
+    
+    # Convert to response format
+    data = _frame_records(result_df)
+    
+    logger.info(
+        f"Analysis complete: {len(result_df)} unique segments, "
+        f"primary_key={config.primary_key}, distribution: {segment_distribution}"
+    )
+    
+    return DynamicXYZAnalysisResponse(
+        total_records=data_quality['total_records_analyzed'],
+        unique_segments=data_quality['unique_segments'],
+        primary_key=config.primary_key,
+        segmentation_level=config.groupby_attributes,
+        segment_distribution=segment_distribution,
+        analysis_params={
+            "primary_key": config.primary_key,
+            "x_threshold": config.x_threshold,
+            "y_threshold": config.y_threshold,
+            "min_periods": config.min_periods,
+            "groupby_attributes": config.groupby_attributes,
+            "aggregation_method": config.aggregation_method.value,
+            "outliers_removed": config.remove_outliers
+        },
+        data=data,
+        data_quality=data_quality,
+        timestamp=datetime.utcnow().isoformat()
+    )
+
+
 @router.post("/analyze/export")
-async def export_dynamic_analysis(
+def export_dynamic_analysis(
     config: SegmentationConfig = Body(...),
     format: str = Query("csv", regex="^(csv|json|excel)$"),
     sap_service: SAPService = Depends(get_sap_service)
@@ -285,21 +371,20 @@ async def export_dynamic_analysis(
     logger.info(f"Export requested: format={format}, primary_key={config.primary_key}")
     
     try:
-        # Determine additional attributes to fetch
-        additional_attrs = [a for a in config.groupby_attributes if a != config.primary_key]
-        
         # Fetch and analyze data
         df = sap_service.fetch_data(
             primary_key=config.primary_key,
             additional_filters=config.filters,
-            additional_attributes=additional_attrs
+            additional_attributes=config.additional_attributes
         )
         
         if df.empty:
             raise HTTPException(status_code=404, detail="No data found")
         
         analysis_service = DynamicAnalysisService()
-        result_df, data_quality = analysis_service.calculate_dynamic_xyz_segmentation(df, config)
+        result_df, data_quality = analysis_service.calculate_cached_xyz_segmentation(
+            df, config, SAPService.extraction_id(df)
+        )
         
         if result_df.empty:
             raise HTTPException(status_code=422, detail="No segments produced")
@@ -314,12 +399,8 @@ async def export_dynamic_analysis(
         level_str = f"{config.primary_key}_{'_'.join(config.groupby_attributes)}".lower()
         
         if format == "csv":
-            output = io.StringIO()
-            result_df.to_csv(output, index=False)
-            output.seek(0)
-            
             return StreamingResponse(
-                iter([output.getvalue()]),
+                _iter_csv(result_df),
                 media_type="text/csv",
                 headers={
                     "Content-Disposition": f"attachment; filename=xyz_analysis_{level_str}_{timestamp}.csv"
@@ -342,19 +423,14 @@ async def export_dynamic_analysis(
             with pd.ExcelWriter(output, engine='openpyxl') as writer:
                 result_df.to_excel(writer, sheet_name='XYZ Analysis', index=False)
                 
-                # Summary sheet
-                summary_data = []
-                for segment in ['X', 'Y', 'Z']:
-                    seg_data = result_df[result_df['XYZ_Segment'] == segment]
-                    if not seg_data.empty:
-                        summary_data.append({
-                            'Segment': segment,
-                            'Count': len(seg_data),
-                            'Avg_CV': seg_data['CV'].mean(),
-                            'Avg_Mean': seg_data['mean'].mean()
-                        })
-                
-                summary_df = pd.DataFrame(summary_data)
+                # Summary sheet: one grouped pass, segments in X/Y/Z order
+                summary = result_df.groupby('XYZ_Segment').agg(
+                    Count=('CV', 'size'),
+                    Avg_CV=('CV', 'mean'),
+                    Avg_Mean=('mean', 'mean')
+                )
+                summary = summary.loc[[seg for seg in ['X', 'Y', 'Z'] if seg in summary.index]]
+                summary_df = summary.rename_axis('Segment').reset_index()
                 summary_df.to_excel(writer, sheet_name='Summary', index=False)
             
             output.seek(0)
@@ -10,11 +10,13 @@ Key fixes:
 
 from fastapi import APIRouter, Depends, Query, HTTPException, Body
 from datetime import datetime
-from typing import Optional
-from enum import Enum
+from typing import Optional, List
+import pandas as pd
 
 from app.models.write_schemas import (
+    WriteMode,
     XYZWriteRequest,
+    XYZCustomWriteRequest,
     XYZWriteResponse,
     XYZWriteStatus,
     BatchWriteResponse
@@ -30,16 +32,58 @@ from app.utils.logger import get_logger
 router = APIRouter(prefix="/api/v1/xyz-write", tags=["XYZ Write-Back"])
 logger = get_logger(__name__)
 
+# Routes that call SAP or run pandas work are declared with plain def, so
+# FastAPI runs them in its threadpool instead of blocking the event loop
 
-class WriteMode(str, Enum):
-    """Write mode options"""
-    SIMPLE = "simple"
-    BATCHED = "batched"
-    PARALLEL = "parallel"
+
+# Segment values accepted by write-custom
+VALID_SEGMENTS = frozenset({'X', 'Y', 'Z'})
+
+
+def _segmentation_config(
+    primary_key: str,
+    groupby_attrs: List[str],
+    x_threshold: float,
+    y_threshold: float,
+    filters: Optional[str]
+) -> SegmentationConfig:
+    """Validated analysis config for a write request (shared by write-segments and debug-payload)"""
+    return SegmentationConfig(
+        primary_key=primary_key,
+        groupby_attributes=groupby_attrs,
+        x_threshold=x_threshold,
+        y_threshold=y_threshold,
+        min_periods=6,  # Can be made configurable
+        filters=filters
+    )
+
+
+def _build_write_frame(
+    df: pd.DataFrame,
+    result_df: pd.DataFrame,
+    groupby_attrs: List[str],
+    period_field: Optional[str]
+) -> pd.DataFrame:
+    """
+    Segment rows to write back: grouping dimensions, XYZ_Segment and the period
+    
+    The period is the first one seen for each combination in the source data,
+    found in a single unsorted groupby pass and joined on the grouping keys.
+    """
+    # Keep all grouping dimensions plus XYZ_Segment (column selection already copies)
+    write_df = result_df[groupby_attrs + ['XYZ_Segment']]
+    
+    # Add period field if available and not already in groupby
+    if period_field and period_field in df.columns and period_field not in write_df.columns:
+        # The merge aligns on keys, so the groups need no sorting
+        period_data = df.groupby(groupby_attrs, sort=False, observed=True)[period_field].first().reset_index()
+        write_df = write_df.merge(period_data, on=groupby_attrs, how='left')
+    
+    return write_df
 
 
 @router.post("/write-segments", response_model=XYZWriteResponse)
-async def write_xyz_segments(
+def write_xyz_segments(
     request: XYZWriteRequest = Body(...),
     sap_service: SAPService = Depends(get_sap_service),
     write_service: SAPWriteService = Depends(get_sap_write_service)
@@ -87,16 +131,18 @@ async def write_xyz_segments(
         )
     
     try:
+        # Build segmentation config (also resolves the attributes to fetch)
+        config = _segmentation_config(
+            primary_key, groupby_attrs, x_thresh, y_thresh, request.filters
+        )
+        
         # Step 1: Fetch data from SAP
         logger.info(f"Step 1: Fetching data from SAP IBP with primary_key={primary_key}")
         
-        # Determine additional attributes to fetch
-        additional_attrs = [attr for attr in groupby_attrs if attr != primary_key]
-        
         df = sap_service.fetch_data(
             primary_key=primary_key,
             additional_filters=request.filters,
-            additional_attributes=additional_attrs
+            additional_attributes=config.additional_attributes
         )
         
         if df.empty:
@@ -107,19 +153,11 @@ async def write_xyz_segments(
         # Step 2: Perform XYZ analysis
         logger.info(f"Step 2: Performing XYZ segmentation with groupby={groupby_attrs}")
         
-        # Build segmentation config
-        config = SegmentationConfig(
-            primary_key=primary_key,
-            groupby_attributes=groupby_attrs,
-            x_threshold=x_thresh,
-            y_threshold=y_thresh,
-            min_periods=6,  # Can be made configurable
-            filters=request.filters
-        )
-        
         # Use dynamic analysis service
         analysis_service = DynamicAnalysisService()
-        result_df, data_quality = analysis_service.calculate_dynamic_xyz_segmentation(df, config)
+        result_df, data_quality = analysis_service.calculate_cached_xyz_segmentation(
+            df, config, SAPService.extraction_id(df)
+        )
         
         if result_df.empty:
             raise HTTPException(
@@ -130,21 +168,13 @@ async def write_xyz_segments(
         logger.info(f"Analysis complete: {len(result_df)} segments produced")
         
         # Step 3: Prepare data for write-back
-        # Keep all grouping dimensions plus XYZ_Segment
-        write_columns = groupby_attrs + ['XYZ_Segment']
-        write_df = result_df[write_columns].copy()
-        
-        # Add period field if available and not already in groupby
-        if request.period_field and request.period_field in df.columns:
-            if request.period_field not in write_df.columns:
-                # Get the first period for each unique combination
-                period_data = df.groupby(groupby_attrs)[request.period_field].first().reset_index()
-                write_df = write_df.merge(period_data, on=groupby_attrs, how='left')
+        write_df = _build_write_frame(df, result_df, groupby_attrs, request.period_field)
         
         logger.info(f"Prepared {len(write_df)} segments for write-back")
         logger.info(f"Write columns: {list(write_df.columns)}")
         
         # Step 4: Write to SAP based on mode
+        period_field = request.period_field or "PERIODID3_TSTAMP"
         logger.info(f"Step 3: Writing to SAP IBP using {request.write_mode} mode")
         
         if request.write_mode == WriteMode.SIMPLE:
@@ -153,7 +183,7 @@ async def write_xyz_segments(
                 primary_key=primary_key,
                 version_id=request.version_id,
                 scenario_id=request.scenario_id,
-                period_field=request.period_field or "PERIODID3_TSTAMP"
+                period_field=period_field
             )
         
         elif request.write_mode == WriteMode.BATCHED:
@@ -162,7 +192,7 @@ async def write_xyz_segments(
                 primary_key=primary_key,
                 version_id=request.version_id,
                 scenario_id=request.scenario_id,
-                period_field=request.period_field or "PERIODID3_TSTAMP",
+                period_field=period_field,
                 batch_size=request.batch_size or 5000
             )
         
@@ -172,13 +202,13 @@ async def write_xyz_segments(
                 primary_key=primary_key,
                 version_id=request.version_id,
                 scenario_id=request.scenario_id,
-                period_field=request.period_field or "PERIODID3_TSTAMP",
+                period_field=period_field,
                 batch_size=request.batch_size or 5000,
                 max_workers=request.max_workers or 4
             )
         
-        # Calculate segment distribution
-        segment_counts = result_df['XYZ_Segment'].value_counts().to_dict()
+        # Segment distribution was already counted by the analysis
+        segment_counts = data_quality['segment_distribution']
         
         logger.info(f"Write operation completed successfully: {write_result.get('transaction_id')}")
         
@@ -210,13 +240,8 @@ async def write_xyz_segments(
 
 
 @router.post("/write-custom", response_model=XYZWriteResponse)
-async def write_custom_segments(
-    segments: list = Body(..., description="List of segment assignments"),
-    primary_key: str = Body("PRDID", description="Primary key for segmentation"),
-    version_id: Optional[str] = Body(None),
-    scenario_id: Optional[str] = Body(None),
-    period_field: str = Body("PERIODID3_TSTAMP"),
-    write_mode: WriteMode = Body(WriteMode.SIMPLE),
+def write_custom_segments(
+    request: XYZCustomWriteRequest = Body(...),
     write_service: SAPWriteService = Depends(get_sap_write_service)
 ):
     """
@@ -235,24 +260,39 @@ async def write_custom_segments(
     }
     ```
     """
+    segments = request.segments
+    primary_key = request.primary_key
+    version_id = request.version_id
+    scenario_id = request.scenario_id
+    period_field = request.period_field
+    write_mode = request.write_mode
+    
     logger.info(f"Custom segment write requested: {len(segments)} segments, primary_key={primary_key}")
     
     try:
-        import pandas as pd
-        
-        # Convert to DataFrame
-        write_df = pd.DataFrame(segments)
-        
-        # Validate required columns
-        if primary_key not in write_df.columns or 'XYZ_Segment' not in write_df.columns:
+        # Reject an empty list up front, before any per-record work
+        if not segments:
+            raise HTTPException(status_code=400, detail="No segments provided")
+        
+        # Validate required fields on every record before building the frame;
+        # the dict-view subset test checks all required keys in one C call
+        required_fields = {primary_key, 'XYZ_Segment'}
+        missing_idx = next(
+            (i for i, segment in enumerate(segments) if not segment.keys() >= required_fields),
+            None
+        )
+        if missing_idx is not None:
             raise HTTPException(
                 status_code=400,
-                detail=f"Each segment must have '{primary_key}' and 'XYZ_Segment' fields"
+                detail=f"Each segment must have '{primary_key}' and 'XYZ_Segment' fields "
+                       f"(segments[{missing_idx}] does not)"
             )
         
+        # Convert to DataFrame
+        write_df = pd.DataFrame(segments)
+        
         # Validate segment values
-        valid_segments = {'X', 'Y', 'Z'}
-        invalid_segments = set(write_df['XYZ_Segment'].unique()) - valid_segments
+        invalid_segments = set(write_df['XYZ_Segment'].unique()) - VALID_SEGMENTS
         if invalid_segments:
             raise HTTPException(
                 status_code=400,
@@ -312,55 +352,56 @@ async def write_custom_segments(
 
 
 @router.get("/status/{transaction_id}", response_model=XYZWriteStatus)
-async def get_write_status(
+def get_write_status(
     transaction_id: str,
+    fields_only: bool = Query(False, description="Return only message type and text"),
     write_service: SAPWriteService = Depends(get_sap_write_service)
 ):
     """Get the status of a write transaction"""
     logger.info(f"Status check requested for transaction: {transaction_id}")
     
     try:
-        session, csrf_token = write_service._get_csrf_token()
-        
-        try:
+        with write_service.csrf_session() as (session, csrf_token):
             export_result = write_service._get_export_result(session, csrf_token, transaction_id)
-            
-            messages = []
-            try:
-                msg_session, msg_csrf = write_service._get_csrf_token()
-                try:
-                    url = f"{write_service.api_url}/Message"
-                    response = msg_session.get(
-                        url,
-                        params={"Transactionid": transaction_id},
-                        headers={"X-CSRF-Token": msg_csrf},
-                        timeout=write_service.timeout
-                    )
-                    if response.ok:
-                        messages = response.json()
-                except Exception as e:
-                    logger.warning(f"Could not fetch messages: {str(e)}")
-                finally:
-                    msg_session.close()
-            except Exception:
-                pass
-            
-            return XYZWriteStatus(
-                transaction_id=transaction_id,
-                status="completed" if export_result else "unknown",
-                export_result=export_result,
-                messages=messages,
-                timestamp=datetime.utcnow().isoformat()
-            )
         
-        finally:
-            session.close()
+        messages = write_service.get_messages(transaction_id, fields_only=fields_only)
+        
+        return XYZWriteStatus(
+            transaction_id=transaction_id,
+            status="completed" if export_result else "unknown",
+            export_result=export_result,
+            messages=messages,
+            timestamp=datetime.utcnow().isoformat()
+        )
         
     except Exception as e:
         logger.error(f"Status check failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/status/{transaction_id}/message-count")
+def get_write_message_count(
+    transaction_id: str,
+    write_service: SAPWriteService = Depends(get_sap_write_service)
+):
+    """Get only the number of messages for a write transaction"""
+    logger.info(f"Message count requested for transaction: {transaction_id}")
+    
+    try:
+        message_count = write_service.count_messages(transaction_id)
+        
+        return {
+            "transaction_id": transaction_id,
+            "message_count": message_count,
+            "has_messages": message_count > 0,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"Message count failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/validate-config")
 async def validate_write_config(
     write_service: SAPWriteService = Depends(get_sap_write_service)
@@ -385,7 +426,7 @@ async def validate_write_config(
     }
 
 @router.post("/debug-payload")
-async def debug_write_payload(
+def debug_write_payload(
     request: XYZWriteRequest = Body(...),
     sap_service: SAPService = Depends(get_sap_service),
     write_service: SAPWriteService = Depends(get_sap_write_service)
@@ -407,45 +448,31 @@ async def debug_write_payload(
         groupby_attrs = ["PRDID"]
     
     try:
+        config = _segmentation_config(
+            primary_key, groupby_attrs, x_thresh, y_thresh, request.filters
+        )
+        
         # Fetch data
-        additional_attrs = [attr for attr in groupby_attrs if attr != primary_key]
         df = sap_service.fetch_data(
             primary_key=primary_key,
             additional_filters=request.filters,
-            additional_attributes=additional_attrs
+            additional_attributes=config.additional_attributes
         )
         
         if df.empty:
             raise HTTPException(status_code=404, detail="No data found")
         
         # Perform analysis
-        from app.services.dynamic_analysis_service import DynamicAnalysisService
-        from app.models.segmentation_schemas import SegmentationConfig
-        
-        config = SegmentationConfig(
-            primary_key=primary_key,
-            groupby_attributes=groupby_attrs,
-            x_threshold=x_thresh,
-            y_threshold=y_thresh,
-            min_periods=6,
-            filters=request.filters
-        )
-        
         analysis_service = DynamicAnalysisService()
-        result_df, data_quality = analysis_service.calculate_dynamic_xyz_segmentation(df, config)
+        result_df, data_quality = analysis_service.calculate_cached_xyz_segmentation(
+            df, config, SAPService.extraction_id(df)
+        )
         
         if result_df.empty:
             raise HTTPException(status_code=422, detail="No segments produced")
         
         # Prepare write data
-        write_columns = groupby_attrs + ['XYZ_Segment']
-        write_df = result_df[write_columns].copy()
-        
-        # Add period field
-        if request.period_field and request.period_field in df.columns:
-            if request.period_field not in write_df.columns:
-                period_data = df.groupby(groupby_attrs)[request.period_field].first().reset_index()
-                write_df = write_df.merge(period_data, on=groupby_attrs, how='left')
+        write_df = _build_write_frame(df, result_df, groupby_attrs, request.period_field)
         
         # Generate transaction ID
         transaction_id = write_service._generate_transaction_id()
@@ -485,7 +512,7 @@ async def debug_write_payload(
             },
             "data_analysis": {
                 "total_segments": len(result_df),
-                "segment_distribution": result_df['XYZ_Segment'].value_counts().to_dict(),
+                "segment_distribution": data_quality['segment_distribution'],
                 "primary_key": primary_key,
                 "dimensions_included": list(write_df.columns)
             },
@@ -13,18 +13,26 @@ class Settings(BaseSettings):
     APP_NAME: str = "SAP IBP XYZ Analysis API"
     APP_VERSION: str = "2.0.0"
     DEBUG: bool = False
+    GZIP_MIN_RESPONSE_BYTES: int = 1024  # Gzip responses at least this large when the client accepts it (0 compresses all)
     
     # SAP IBP Read Configuration (existing)
     SAP_API_URL: str
     SAP_USERNAME: str
     SAP_PASSWORD: str
     SAP_TIMEOUT: int = 30
+    SAP_MAX_RETRIES: int = 5  # Retries for throttled/transient 5xx responses (0 disables)
+    SAP_PAGE_SIZE: int = 50000  # Records requested per OData page ($top)
+    SAP_READ_CACHE_TTL: int = 300  # Seconds to reuse an identical fetch (0 disables)
+    SAP_CACHE_DIR: str = ""  # Persist extractions on disk here, for dev/test runs (empty disables)
+    SAP_DISK_CACHE_TTL: int = 86400  # Seconds an on-disk extraction stays valid
+    SAP_FLOAT32_QUANTITIES: bool = False  # Store ACTUALSQTY as float32 (half the memory, ~7 significant digits)
     
     # SAP IBP Write Configuration (new)
     SAP_WRITE_API_URL: str = ""  # e.g., https://your-tenant.sap.com/sap/opu/odata/sap/IBP_PLANNING_DATA_API_SRV
     SAP_PLANNING_AREA: str = ""  # e.g., SAP1, SAP2, YSAPIBP1
     SAP_XYZ_KEY_FIGURE: str = "XYZID"  # Name of the key figure in IBP to store segment
     SAP_ENABLE_NULL_HANDLING: bool = False  # Set to True if ENABLE_NULL_INFO parameter is set in SAP IBP
+    SAP_COMPRESS_PAYLOADS: bool = False  # Gzip large write payloads (gateway must accept Content-Encoding: gzip)
     
     # Analysis Configuration
     DEFAULT_X_THRESHOLD: float = 10.0
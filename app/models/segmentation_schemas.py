@@ -7,11 +7,16 @@ Key changes:
 3. Made groupby_attributes more flexible
 """
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, field_validator
 from typing import List, Optional, Dict, Any
 from enum import Enum
 
 
+# Attributes accepted as primary_key; the frozenset is used for membership checks
+PRIMARY_KEY_OPTIONS = ['PRDID', 'LOCID', 'CUSTID', 'PRDGRPID', 'REGIONID', 'SALESORGID', 'CHANID', 'DIVID']
+_PRIMARY_KEY_SET = frozenset(PRIMARY_KEY_OPTIONS)
+
+
 class AggregationMethod(str, Enum):
     """Methods for handling multiple periods"""
     MEAN_STD = "mean_std"
@@ -30,7 +35,7 @@ class SegmentationConfig(BaseModel):
     groupby_attributes: List[str] = Field(
         ...,
         description="List of attributes to group by (e.g., ['PRDID', 'LOCID'])",
-        min_items=1
+        min_length=1
     )
     
     x_threshold: float = Field(
@@ -75,33 +80,49 @@ class SegmentationConfig(BaseModel):
         description="Additional OData filters"
     )
     
-    @validator('primary_key')
+    @field_validator('primary_key')
+    @classmethod
     def validate_primary_key(cls, v):
         """Ensure primary key is a valid attribute"""
-        valid_keys = ['PRDID', 'LOCID', 'CUSTID', 'PRDGRPID', 'REGIONID', 'SALESORGID', 'CHANID', 'DIVID']
-        if v not in valid_keys:
-            raise ValueError(f'primary_key must be one of: {valid_keys}')
+        if v not in _PRIMARY_KEY_SET:
+            raise ValueError(f'primary_key must be one of: {PRIMARY_KEY_OPTIONS}')
+        return v
+    
+    @field_validator('min_periods', mode='before')
+    @classmethod
+    def reject_boolean_periods(cls, v):
+        """Reject JSON booleans, which lax int validation would read as 0/1"""
+        if type(v) is bool:
+            raise ValueError('min_periods must be an integer, not a boolean')
         return v
     
-    @validator('y_threshold')
-    def validate_thresholds(cls, v, values):
+    @field_validator('y_threshold')
+    @classmethod
+    def validate_thresholds(cls, v, info: ValidationInfo):
         """Ensure Y threshold is greater than X threshold"""
+        values = info.data
         if 'x_threshold' in values and v <= values['x_threshold']:
             raise ValueError('y_threshold must be greater than x_threshold')
         return v
     
-    @validator('groupby_attributes')
-    def validate_attributes(cls, v, values):
+    @field_validator('groupby_attributes')
+    @classmethod
+    def validate_attributes(cls, v, info: ValidationInfo):
         """Validate that primary_key is included in groupby_attributes"""
         # Get primary_key from values - it should already be validated
-        primary_key = values.get('primary_key', 'PRDID')
+        primary_key = info.data.get('primary_key', 'PRDID')
         
         if primary_key not in v:
             raise ValueError(f'{primary_key} must be included in groupby_attributes')
         return v
     
-    class Config:
-        json_schema_extra = {
+    @property
+    def additional_attributes(self) -> List[str]:
+        """Grouping attributes other than primary_key (the extra columns to fetch)"""
+        return [attr for attr in self.groupby_attributes if attr != self.primary_key]
+    
+    model_config = ConfigDict(
+        json_schema_extra={
             "examples": [
                 {
                     "name": "Product-based segmentation",
@@ -135,6 +156,7 @@ class SegmentationConfig(BaseModel):
                 }
             ]
         }
+    )
 
 
 class AttributeInfo(BaseModel):
@@ -1,5 +1,13 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, field_validator
 from typing import Optional, Dict, List, Any
+from enum import Enum
+
+
+class WriteMode(str, Enum):
+    """Write mode options"""
+    SIMPLE = "simple"
+    BATCHED = "batched"
+    PARALLEL = "parallel"
 
 
 class XYZWriteRequest(BaseModel):
@@ -25,8 +33,16 @@ class XYZWriteRequest(BaseModel):
     batch_size: Optional[int] = Field(5000, description="Records per batch", ge=1, le=10000)
     max_workers: Optional[int] = Field(4, description="Parallel workers (parallel mode only)", ge=1, le=10)
     
-    class Config:
-        json_schema_extra = {
+    @field_validator('batch_size', 'max_workers', mode='before')
+    @classmethod
+    def reject_boolean_counts(cls, v, info: ValidationInfo):
+        """Reject JSON booleans, which lax int validation would read as 0/1"""
+        if type(v) is bool:
+            raise ValueError(f'{info.field_name} must be an integer, not a boolean')
+        return v
+    
+    model_config = ConfigDict(
+        json_schema_extra={
             "examples": [
                 {
                     "name": "Product-Location Segmentation",
@@ -51,6 +67,34 @@ class XYZWriteRequest(BaseModel):
                 }
             ]
         }
+    )
+
+
+class XYZCustomWriteRequest(BaseModel):
+    """Request model for writing caller-provided XYZ segments to SAP"""
+    
+    segments: List[Dict[str, Any]] = Field(..., description="List of segment assignments")
+    primary_key: str = Field("PRDID", description="Primary key for segmentation")
+    version_id: Optional[str] = Field(None, description="Target version ID (None = base version)")
+    scenario_id: Optional[str] = Field(None, description="Target scenario ID (None = baseline)")
+    period_field: str = Field("PERIODID3_TSTAMP", description="Period field name")
+    write_mode: WriteMode = Field(WriteMode.SIMPLE, description="Write mode: simple, batched, or parallel")
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "examples": [
+                {
+                    "segments": [
+                        {"PRDID": "IBP-100", "LOCID": "1720", "XYZ_Segment": "X"},
+                        {"PRDID": "IBP-110", "LOCID": "1720", "XYZ_Segment": "Y"}
+                    ],
+                    "primary_key": "PRDID",
+                    "version_id": "CONSENSUS",
+                    "write_mode": "simple"
+                }
+            ]
+        }
+    )
 
 
 class XYZWriteResponse(BaseModel):
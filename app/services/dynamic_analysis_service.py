@@ -7,12 +7,15 @@ Key changes:
 3. More flexible grouping logic
 """
 
+import copy
+import logging
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Tuple
-from scipy import stats
+from typing import List, Dict, Any, Optional, Tuple, Hashable
+from app.config import get_settings
+from app.utils.cache import ttl_cache
 from app.utils.logger import get_logger
-from app.models.segmentation_schemas import SegmentationConfig
+from app.models.segmentation_schemas import SegmentationConfig, RecommendedCombination
 
 logger = get_logger(__name__)
 
@@ -20,11 +23,12 @@ logger = get_logger(__name__)
 class DynamicAnalysisService:
     """Service for performing dynamic XYZ segmentation analysis"""
     
+    # Segment label for each CV band, indexed by position relative to (x, y) thresholds
+    SEGMENT_LABELS = np.array(['X', 'Y', 'Z'], dtype=object)
+    
     @staticmethod
     def get_recommended_combinations(df: pd.DataFrame, attributes: List[str]) -> List[dict]:
         """Generate recommended attribute combinations based on data"""
-        from app.models.segmentation_schemas import RecommendedCombination
-        
         recommendations = []
         
         # Single key recommendations
@@ -42,7 +46,7 @@ class DynamicAnalysisService:
         
         # Multi-dimensional combinations
         if 'PRDID' in attributes and 'LOCID' in attributes:
-            estimated = df.groupby(['PRDID', 'LOCID']).ngroups
+            estimated = df.groupby(['PRDID', 'LOCID'], observed=True).ngroups
             rec = RecommendedCombination(
                 level='Product-Location Level',
                 primary_key='PRDID',
@@ -54,7 +58,7 @@ class DynamicAnalysisService:
             recommendations.append(rec.model_dump())
         
         if 'LOCID' in attributes and 'CUSTID' in attributes:
-            estimated = df.groupby(['LOCID', 'CUSTID']).ngroups
+            estimated = df.groupby(['LOCID', 'CUSTID'], observed=True).ngroups
             rec = RecommendedCombination(
                 level='Location-Customer Level',
                 primary_key='LOCID',
@@ -77,9 +81,11 @@ class DynamicAnalysisService:
         
         warnings = []
         
-        # Check if all requested attributes exist
-        missing_attrs = [attr for attr in config.groupby_attributes if attr not in df.columns]
-        if missing_attrs:
+        # Check if all requested attributes exist (one subset test; the
+        # missing list is only built when something is absent)
+        available = set(df.columns)
+        if not available.issuperset(config.groupby_attributes):
+            missing_attrs = [attr for attr in config.groupby_attributes if attr not in available]
             warnings.append(f"Attributes not found in data: {missing_attrs}")
             return {
                 'error': f"Missing attributes: {missing_attrs}",
@@ -87,18 +93,18 @@ class DynamicAnalysisService:
             }
         
         # Verify primary key exists
-        if config.primary_key not in df.columns:
+        if config.primary_key not in available:
             return {
                 'error': f"Primary key {config.primary_key} not found in data",
                 'warnings': warnings
             }
         
-        # Estimate number of segments
-        estimated_segments = df.groupby(config.groupby_attributes).ngroups
+        # Periods per segment group; one grouping also gives the segment estimate
+        periods_per_group = df.groupby(config.groupby_attributes, observed=True).size()
+        estimated_segments = len(periods_per_group)
         
         # Check data sufficiency
-        periods_per_group = df.groupby(config.groupby_attributes).size()
-        insufficient = (periods_per_group < config.min_periods).sum()
+        insufficient = int((periods_per_group < config.min_periods).sum())
         
         if insufficient > 0:
             warnings.append(
@@ -114,7 +120,8 @@ class DynamicAnalysisService:
             'avg_periods_per_segment': float(periods_per_group.mean()),
             'min_periods_per_segment': int(periods_per_group.min()),
             'max_periods_per_segment': int(periods_per_group.max()),
-            'segments_with_sufficient_data': int((periods_per_group >= config.min_periods).sum())
+            # Complement of the insufficient count; no second comparison pass
+            'segments_with_sufficient_data': estimated_segments - insufficient
         }
         
         # Check for extremely high cardinality
@@ -155,29 +162,49 @@ class DynamicAnalysisService:
             return pd.DataFrame(), {}
         
         # Validate attributes exist
-        missing_attrs = [attr for attr in config.groupby_attributes if attr not in df.columns]
-        if missing_attrs:
+        available = set(df.columns)
+        if not available.issuperset(config.groupby_attributes):
+            missing_attrs = [attr for attr in config.groupby_attributes if attr not in available]
             raise ValueError(f"Missing attributes in data: {missing_attrs}")
         
         # Validate primary key
-        if config.primary_key not in df.columns:
+        if config.primary_key not in available:
             raise ValueError(f"Primary key {config.primary_key} not found in data")
         
-        # Remove outliers if requested
-        if config.remove_outliers:
-            logger.info(f"Removing outliers using {config.outlier_threshold} std threshold")
-            df = DynamicAnalysisService._remove_outliers(df, config)
-        
         # Calculate statistics by configured grouping
         logger.debug(f"Grouping by: {config.groupby_attributes}")
         
-        # Group and calculate basic stats
-        group_stats = df.groupby(config.groupby_attributes).agg({
-            'ACTUALSQTY': ['mean', 'std', 'count']
-        }).reset_index()
+        # Factorizing the key columns dominates the cost of grouping, so the
+        # grouping is built once and shared by outlier removal and the stats
+        grouped = df.groupby(config.groupby_attributes, as_index=False, observed=True)['ACTUALSQTY']
         
-        # Flatten column names
-        group_stats.columns = config.groupby_attributes + ['mean', 'std', 'count']
+        # Remove outliers if requested
+        if config.remove_outliers:
+            logger.info(f"Removing outliers using {config.outlier_threshold} std threshold")
+            keep = DynamicAnalysisService._outlier_mask(df, grouped, config)
+            
+            # Aggregate the remaining values by the existing group codes rather
+            # than regrouping the filtered frame by its key columns
+            group_keys = grouped.size()[config.groupby_attributes]
+            kept_stats = df['ACTUALSQTY'][keep].groupby(grouped.ngroup()[keep]).agg(
+                mean='mean',
+                std='std',
+                count='count'
+            )
+            group_stats = group_keys.iloc[kept_stats.index.astype('int64')].reset_index(drop=True)
+            group_stats = group_stats.join(kept_stats.reset_index(drop=True))
+            
+            df = df[keep].reset_index(drop=True)
+        else:
+            # Named aggregation on the single value column yields flat
+            # 'mean', 'std', 'count' columns directly
+            group_stats = grouped.agg(
+                mean='mean',
+                std='std',
+                count='count'
+            )
+        # Report float64 statistics even when quantities are stored as float32
+        group_stats[['mean', 'std']] = group_stats[['mean', 'std']].astype('float64')
         
         # Filter by minimum periods
         initial_count = len(group_stats)
@@ -190,41 +217,47 @@ class DynamicAnalysisService:
                 f"(< {config.min_periods} periods)"
             )
         
-        # Calculate Coefficient of Variation
-        group_stats['CV'] = (group_stats['std'] / group_stats['mean']) * 100
-        
-        # Handle edge cases
-        group_stats['CV'] = group_stats['CV'].fillna(0)  # When std is 0
-        group_stats['CV'] = group_stats['CV'].replace([np.inf, -np.inf], 999)  # When mean is 0
+        # Calculate Coefficient of Variation, dividing only where the mean is non-zero
+        std = group_stats['std'].to_numpy()
+        mean = group_stats['mean'].to_numpy()
+        zero_mean = mean == 0
+        cv = np.divide(std, mean, out=np.zeros_like(std), where=~zero_mean) * 100
         
-        # Apply segmentation logic
-        conditions = [
-            (group_stats['CV'] <= config.x_threshold),
-            ((group_stats['CV'] > config.x_threshold) & (group_stats['CV'] <= config.y_threshold)),
-            (group_stats['CV'] > config.y_threshold)
-        ]
-        choices = ['X', 'Y', 'Z']
+        # Handle edge cases: a zero mean with spread gets the 999 sentinel (0 without);
+        # an undefined std counts as no spread and overflowing ratios also get 999
+        cv[zero_mean & (std > 0)] = 999
+        group_stats['CV'] = np.nan_to_num(cv, nan=0.0, posinf=999, neginf=999)
         
-        group_stats['XYZ_Segment'] = np.select(conditions, choices, default='Unknown')
+        # Apply segmentation logic: CV <= x -> X, x < CV <= y -> Y, CV > y -> Z
+        # (one binary search per row; thresholds are validated as x < y)
+        thresholds = np.array([config.x_threshold, config.y_threshold])
+        segment_idx = np.searchsorted(thresholds, group_stats['CV'].to_numpy(), side='left')
+        group_stats['XYZ_Segment'] = DynamicAnalysisService.SEGMENT_LABELS[segment_idx]
         
         # Calculate data quality metrics
         segment_counts = group_stats['XYZ_Segment'].value_counts().to_dict()
+        # Mean CV of every segment in one grouped pass
+        cv_by_segment = group_stats.groupby('XYZ_Segment', sort=False)['CV'].mean()
+        
+        # Bind the columns/sizes used repeatedly below instead of re-indexing
+        segment_total = len(group_stats)
+        period_counts = group_stats['count']
         
         data_quality = {
             'total_records_analyzed': len(df),
-            'unique_segments': len(group_stats),
+            'unique_segments': segment_total,
             'primary_key': config.primary_key,
             'primary_key_unique_values': int(df[config.primary_key].nunique()),
-            'records_with_sufficient_history': len(group_stats),
+            'records_with_sufficient_history': segment_total,
             'records_excluded': excluded_count,
-            'avg_periods_per_segment': float(group_stats['count'].mean()),
-            'min_periods_per_segment': int(group_stats['count'].min()) if len(group_stats) > 0 else 0,
-            'max_periods_per_segment': int(group_stats['count'].max()) if len(group_stats) > 0 else 0,
+            'avg_periods_per_segment': float(period_counts.mean()),
+            'min_periods_per_segment': int(period_counts.min()) if segment_total > 0 else 0,
+            'max_periods_per_segment': int(period_counts.max()) if segment_total > 0 else 0,
             'segment_distribution': segment_counts,
             'avg_cv_by_segment': {
-                segment: float(group_stats[group_stats['XYZ_Segment'] == segment]['CV'].mean())
+                segment: float(cv_by_segment[segment])
                 for segment in ['X', 'Y', 'Z']
-                if segment in group_stats['XYZ_Segment'].values
+                if segment in cv_by_segment.index
             }
         }
         
@@ -234,23 +267,64 @@ class DynamicAnalysisService:
         return group_stats, data_quality
     
     @staticmethod
-    def _remove_outliers(df: pd.DataFrame, config: SegmentationConfig) -> pd.DataFrame:
-        """Remove statistical outliers from the dataset"""
-        initial_count = len(df)
+    def calculate_cached_xyz_segmentation(
+        df: pd.DataFrame,
+        config: SegmentationConfig,
+        data_key: Optional[Hashable]
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        calculate_dynamic_xyz_segmentation memoized per extraction and config
         
-        df_clean = df.copy()
+        The usual analyze -> export -> write sequence runs the same analysis on
+        the same extraction several times. data_key must identify the frame
+        itself, not the request that fetched it (see SAPService.extraction_id),
+        so a refetch after the read cache expires never reuses a result computed
+        from the old data. Without a data_key the analysis is not memoized.
+        """
+        if data_key is None:
+            return DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+        
+        result_df, data_quality = DynamicAnalysisService._memoized_segmentation(df, config, data_key)
+        # Callers add columns to the result and may edit the summary; copies
+        # keep the cached entry intact (the nested summary dicts are tiny)
+        return result_df.copy(deep=False), copy.deepcopy(data_quality)
+    
+    @staticmethod
+    @ttl_cache(
+        maxsize=16,
+        ttl=lambda: get_settings().SAP_READ_CACHE_TTL,
+        key=lambda df, config, data_key: (data_key, config.model_dump_json())
+    )
+    def _memoized_segmentation(
+        df: pd.DataFrame,
+        config: SegmentationConfig,
+        data_key: Hashable
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Cached body of calculate_cached_xyz_segmentation"""
+        return DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+    
+    @staticmethod
+    def _outlier_mask(
+        df: pd.DataFrame,
+        grouped: "pd.core.groupby.SeriesGroupBy",
+        config: SegmentationConfig
+    ) -> pd.Series:
+        """Flag the rows of df that are not statistical outliers within their group"""
+        initial_count = len(df)
         
-        def remove_group_outliers(group):
-            if len(group) < 3:  # Need at least 3 points for z-score
-                return group
-            z_scores = np.abs(stats.zscore(group['ACTUALSQTY']))
-            return group[z_scores < config.outlier_threshold]
+        # Per-group z-scores in one vectorized pass (population std, as scipy.stats.zscore)
+        group_size = grouped.transform('size')
+        group_mean = grouped.transform('mean')
+        group_std = grouped.transform('std', ddof=0)
+        z_scores = (df['ACTUALSQTY'] - group_mean).abs() / group_std
         
-        df_clean = df_clean.groupby(config.groupby_attributes).apply(
-            remove_group_outliers
-        ).reset_index(drop=True)
+        # Groups with fewer than 3 points are kept as-is (too few for a z-score);
+        # NaN z-scores (zero spread) fail the threshold, matching zscore semantics
+        keep = (group_size < 3) | (z_scores < config.outlier_threshold)
         
-        removed_count = initial_count - len(df_clean)
-        logger.info(f"Removed {removed_count} outlier records ({removed_count/initial_count*100:.2f}%)")
+        # Counting the removed rows is a full pass, only worth it when logged
+        if logger.isEnabledFor(logging.INFO):
+            removed_count = initial_count - int(keep.sum())
+            logger.info(f"Removed {removed_count} outlier records ({removed_count/initial_count*100:.2f}%)")
         
-        return df_clean
\ No newline at end of file
+        return keep
@@ -7,15 +7,96 @@ Key changes:
 3. More flexible attribute handling
 """
 
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import xml.etree.ElementTree as ET
 import pandas as pd
-from typing import Optional, List
+from pathlib import Path
+from typing import Optional, List, Dict, Hashable, Iterable, Iterator, Tuple, BinaryIO
+from functools import lru_cache, partial
+from urllib.parse import urlparse, quote, unquote
 from app.config import get_settings
 from app.utils.logger import get_logger
+from app.utils.cache import ttl_cache
+from app.utils.retry import idempotent_retry
 
 logger = get_logger(__name__)
 
+# Case-insensitive ' or ' operator; searched in place without lowercasing a copy
+_OR_OPERATOR_RE = re.compile(' or ', re.IGNORECASE)
+
+# Percent-encoder for OData query options; keeps the characters SAP expects literally
+_QUOTE = partial(quote, safe="()',:")
+
+# Source of the per-load ids stamped on extracted frames (see SAPService.extraction_id)
+_EXTRACTION_IDS = itertools.count(1)
+
+
+@lru_cache(maxsize=1)
+def _get_read_session() -> requests.Session:
+    """
+    Process-wide session for the read API
+    
+    Reusing one pooled keep-alive session means paginated extractions and
+    back-to-back requests skip the TCP/TLS handshake after the first call.
+    Throttled and transient 5xx responses are retried by the adapter, so a
+    hiccup on one page does not abort the whole extraction.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=10,
+        max_retries=idempotent_retry(get_settings().SAP_MAX_RETRIES)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@lru_cache(maxsize=128)
+def _build_query_filter(additional_filters: Optional[str]) -> str:
+    """Combine the base read filter with optional user filters (memoized per filter string)"""
+    # Build filter with proper parentheses
+    base_filter = "UOMTOID eq 'EA' and ACTUALSQTY gt 0"
+    
+    if additional_filters:
+        # FIXED: Wrap additional_filters in parentheses if it contains 'or'
+        if _OR_OPERATOR_RE.search(additional_filters):
+            # Wrap the additional filters in parentheses
+            query_filter = f"{base_filter} and ({additional_filters})"
+            logger.info(f"Applied filter with OR logic: {query_filter}")
+        else:
+            # Simple AND conditions don't need extra parentheses
+            query_filter = f"{base_filter} and {additional_filters}"
+    else:
+        query_filter = base_filter
+    
+    return query_filter
+
+
+def _raw_query_param(url: str, name: str) -> Optional[str]:
+    """
+    Value of a query parameter exactly as it appears in url
+    
+    The value stays percent-encoded, so a server token containing '+', '&'
+    or '%' can be sent back verbatim instead of being decoded and mangled.
+    """
+    for param in urlparse(url).query.split('&'):
+        key, _, value = param.partition('=')
+        if unquote(key) == name:
+            return value
+    return None
+
 
 class SAPService:
     """Service for interacting with SAP IBP OData API"""
@@ -44,12 +125,23 @@ class SAPService:
         'DIVID'
     ]
     
+    # Hashed copies of the lists above for membership checks
+    _AVAILABLE_ATTRIBUTE_SET = frozenset(AVAILABLE_ATTRIBUTES)
+    _PRIMARY_KEY_SET = frozenset(PRIMARY_KEY_ATTRIBUTES)
+    
+    # Measures; every other selected field is part of the record key
+    _MEASURE_FIELDS = frozenset(['ACTUALSQTY'])
+    
+    # DataFrame.attrs entry identifying the load a frame came from
+    EXTRACTION_ID_ATTR = 'extraction_id'
+    
     def __init__(self):
         self.settings = get_settings()
         self.api_url = self.settings.SAP_API_URL
         self.username = self.settings.SAP_USERNAME
         self.password = self.settings.SAP_PASSWORD
         self.timeout = self.settings.SAP_TIMEOUT
+        self.session = _get_read_session()
         
         self.namespaces = {
             'm': 'http://schemas.microsoft.com/ado/2007/08/dataservices/metadata',
@@ -78,7 +170,7 @@ class SAPService:
         logger.info(f"Fetching data from SAP IBP API with primary_key={primary_key}")
         
         # Validate primary key
-        if primary_key not in self.PRIMARY_KEY_ATTRIBUTES:
+        if primary_key not in self._PRIMARY_KEY_SET:
             raise ValueError(
                 f"Invalid primary_key: {primary_key}. "
                 f"Must be one of: {self.PRIMARY_KEY_ATTRIBUTES}"
@@ -89,41 +181,206 @@ class SAPService:
         
         # Add additional attributes if requested
         if additional_attributes:
+            selected = set(select_fields)
             for attr in additional_attributes:
-                if attr not in select_fields and attr in self.AVAILABLE_ATTRIBUTES:
+                if attr not in selected and attr in self._AVAILABLE_ATTRIBUTE_SET:
                     select_fields.append(attr)
+                    selected.add(attr)
                     logger.info(f"Adding attribute: {attr}")
         
-        # Build $select clause
-        select_clause = ','.join(select_fields)
-        
-        # Build filter with proper parentheses
-        base_filter = "UOMTOID eq 'EA' and ACTUALSQTY gt 0"
-        
-        if additional_filters:
-            # FIXED: Wrap additional_filters in parentheses if it contains 'or'
-            if ' or ' in additional_filters.lower():
-                # Wrap the additional filters in parentheses
-                query_filter = f"{base_filter} and ({additional_filters})"
-                logger.info(f"Applied filter with OR logic: {query_filter}")
-            else:
-                # Simple AND conditions don't need extra parentheses
-                query_filter = f"{base_filter} and {additional_filters}"
-        else:
-            query_filter = base_filter
+        query_filter = _build_query_filter(additional_filters)
+        
+        df = self._load_data(primary_key, tuple(select_fields), query_filter)
+        
+        # Shallow copy so callers adding columns never touch the cached frame
+        return df.copy(deep=False)
+    
+    def extraction_key(
+        self,
+        primary_key: str = 'PRDID',
+        additional_filters: Optional[str] = None,
+        additional_attributes: Optional[List[str]] = None
+    ) -> Tuple:
+        """
+        Hashable identity of the extraction fetch_data returns for these arguments
+        
+        Lets callers share one fetch between analyses that read the same data.
+        It names the request, not the data; use extraction_id to key work
+        derived from a fetched frame.
+        """
+        return (self.api_url, primary_key, tuple(additional_attributes or ()), additional_filters)
+    
+    @classmethod
+    def extraction_id(cls, df: pd.DataFrame) -> Optional[Hashable]:
+        """
+        Id of the load a frame returned by fetch_data came from
+        
+        Every fresh pull from SAP gets a new id, while frames served from the
+        read cache keep the id of the load that filled it. Work memoized on
+        this id therefore expires with the cached frame. None for frames not
+        built by _load_data.
+        """
+        return df.attrs.get(cls.EXTRACTION_ID_ATTR)
+    
+    @ttl_cache(
+        maxsize=32,
+        ttl=lambda: get_settings().SAP_READ_CACHE_TTL,
+        key=lambda self, primary_key, select_fields, query_filter: (
+            self.api_url, primary_key, select_fields, query_filter
+        )
+    )
+    def _load_data(self, primary_key: str, select_fields: Tuple[str, ...], query_filter: str) -> pd.DataFrame:
+        """
+        Run the paginated extraction and build the DataFrame
+        
+        Results are memoized for SAP_READ_CACHE_TTL seconds, so the usual
+        preview -> analyze -> write sequence only hits SAP once. Write-back
+        only touches the XYZ key figure, which is never read here, so writes
+        do not invalidate the cache.
+        """
+        rows = self.iter_rows(list(select_fields), query_filter)
+        
+        # Parse XML
+        try:
+            df = self._build_dataframe(rows, list(select_fields))
+            logger.info(f"Successfully parsed {len(df)} records with columns: {list(df.columns)}")
+            
+            # Validate that primary key exists in data
+            if primary_key not in df.columns:
+                raise Exception(f"Primary key {primary_key} not found in response data")
+            
+            df.attrs[self.EXTRACTION_ID_ATTR] = next(_EXTRACTION_IDS)
+            return df
+            
+        except ET.ParseError as e:
+            logger.error(f"XML parsing failed: {str(e)}")
+            raise Exception(f"Failed to parse XML response: {str(e)}")
+    
+    def iter_records(
+        self,
+        select_fields: List[str],
+        query_filter: str,
+        page_size: Optional[int] = None,
+        max_records: Optional[int] = None
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        """Yield records as dicts keyed by the selected field names (see iter_rows)"""
+        for row in self.iter_rows(select_fields, query_filter, page_size, max_records):
+            yield dict(zip(select_fields, row))
+    
+    def iter_rows(
+        self,
+        select_fields: List[str],
+        query_filter: str,
+        page_size: Optional[int] = None,
+        max_records: Optional[int] = None
+    ) -> Iterator[Tuple[Optional[str], ...]]:
+        """
+        Yield rows from SAP IBP page by page
+        
+        The first request asks for $inlinecount=allpages so the loop knows the
+        total up front and stops without probing for an empty page. When the
+        server truncates a page it returns a rel="next" link, whose $skiptoken
+        is sent instead of a client-computed $skip.
+        
+        Each page is parsed straight off the socket, so records reach the
+        caller while the rest of the page is still downloading and callers
+        that stream records elsewhere never materialize the full extraction.
+        Every page is requested in the same $orderby on the key (non-measure)
+        fields: OData only keeps $skip offsets stable over a deterministic order.
+        
+        Args:
+            select_fields: Fields to request via $select
+            query_filter: Complete OData $filter expression
+            page_size: Records per request (defaults to SAP_PAGE_SIZE)
+            max_records: Optional cap on the total number of records yielded
+            
+        Yields:
+            One tuple per entry, holding the values of select_fields in order
+        """
+        page_size = page_size or self.settings.SAP_PAGE_SIZE
+        # Encode once; requests leaves already-escaped sequences alone on every page
+        select_clause = _QUOTE(','.join(select_fields))
+        encoded_filter = _QUOTE(query_filter)
+        order_clause = _QUOTE(','.join(f for f in select_fields if f not in self._MEASURE_FIELDS))
         
-        # Build complete URL
-        url = f"{self.api_url}?$select={select_clause}&$filter={query_filter}"
+        skip = 0
+        skiptoken = None
+        total = None
+        fetched = 0
+        page_number = 1
         
+        while True:
+            top = page_size if max_records is None else min(page_size, max_records - fetched)
+            if top <= 0:
+                break
+            
+            url = (
+                f"{self.api_url}?$select={select_clause}&$filter={encoded_filter}"
+                f"&$orderby={order_clause}&$top={top}"
+            )
+            if skiptoken:
+                url += f"&$skiptoken={skiptoken}"
+            elif skip:
+                url += f"&$skip={skip}"
+            if page_number == 1:
+                url += "&$inlinecount=allpages"
+            
+            logger.info("Fetching page %d (top=%d, skip=%d, skiptoken=%s)", page_number, top, skip, skiptoken)
+            response = self._get(url, stream=True)
+            
+            # Records are yielded while the body is still arriving
+            meta = {}
+            page_count = 0
+            try:
+                for row in self._stream_page(response.raw, select_fields, meta):
+                    page_count += 1
+                    yield row
+            finally:
+                response.close()
+            
+            if meta.get('count') is not None:
+                total = meta['count']
+            next_skiptoken = meta.get('next_skiptoken')
+            
+            fetched += page_count
+            logger.info("Fetched %d records. Total: %d/%s", page_count, fetched, total if total is not None else "?")
+            
+            if not page_count:
+                break
+            
+            if total is not None:
+                target = total if max_records is None else min(total, max_records)
+                if fetched >= target:
+                    break
+            elif not next_skiptoken and page_count < top:
+                break
+            
+            # Prefer the server's continuation; otherwise page by offset
+            skiptoken = next_skiptoken
+            skip = fetched
+            page_number += 1
+    
+    def _get(self, url: str, stream: bool = False) -> requests.Response:
+        """
+        Issue an authenticated GET against the read API
+        
+        With stream=True the body is left unread; the caller consumes
+        response.raw and must close the response.
+        """
         try:
             logger.debug(f"Making request to: {url}")
-            response = requests.get(
+            response = self.session.get(
                 url,
                 auth=(self.username, self.password),
-                timeout=self.timeout
+                timeout=self.timeout,
+                stream=stream
             )
+            if stream:
+                # Let urllib3 undo any gzip/deflate transfer encoding
+                response.raw.decode_content = True
             response.raise_for_status()
             logger.info("API request successful")
+            return response
             
         except requests.exceptions.Timeout:
             logger.error("API request timeout")
@@ -131,49 +388,104 @@ class SAPService:
         except requests.exceptions.RequestException as e:
             logger.error(f"API request failed: {str(e)}")
             raise Exception(f"Failed to fetch data from SAP: {str(e)}")
+    
+    def _parse_page(
+        self,
+        xml_content: bytes,
+        expected_fields: List[str]
+    ) -> Tuple[List[Tuple[Optional[str], ...]], Optional[int], Optional[str]]:
+        """
+        Parse one fully downloaded XML page
         
-        # Parse XML
-        try:
-            df = self._parse_xml_response(response.content, select_fields)
-            logger.info(f"Successfully parsed {len(df)} records with columns: {list(df.columns)}")
-            
-            # Validate that primary key exists in data
-            if primary_key not in df.columns:
-                raise Exception(f"Primary key {primary_key} not found in response data")
-            
-            return df
-            
-        except ET.ParseError as e:
-            logger.error(f"XML parsing failed: {str(e)}")
-            raise Exception(f"Failed to parse XML response: {str(e)}")
+        Returns:
+            Tuple of (rows, inline count if present, $skiptoken of the next link
+            if present, still percent-encoded)
+        """
+        meta = {}
+        rows = list(self._stream_page(io.BytesIO(xml_content), expected_fields, meta))
+        return rows, meta.get('count'), meta.get('next_skiptoken')
     
-    def _parse_xml_response(self, xml_content: bytes, expected_fields: List[str]) -> pd.DataFrame:
-        """Parse XML response and convert to DataFrame"""
-        root = ET.fromstring(xml_content)
-        extracted_data = []
+    def _stream_page(
+        self,
+        source: BinaryIO,
+        expected_fields: List[str],
+        meta: Dict[str, Optional[object]]
+    ) -> Iterator[Tuple[Optional[str], ...]]:
+        """
+        Incrementally parse one XML page, yielding each entry as soon as it closes
+        
+        Each entry becomes a tuple of the expected_fields values (None when a
+        field is absent), which keeps rows compact and lets the DataFrame be
+        built column-wise without per-record key lookups.
+        
+        Finished entries are dropped from the tree, so memory stays flat
+        however large the page is. The inline count and the $skiptoken of the
+        next link (still percent-encoded, ready to send back) are stored in
+        ``meta`` under 'count' and 'next_skiptoken'; the next link follows the
+        entries, so read them after exhausting the generator.
+        """
+        entry_tag = '{http://www.w3.org/2005/Atom}entry'
+        link_tag = '{http://www.w3.org/2005/Atom}link'
+        count_tag = f"{{{self.namespaces['m']}}}count"
+        # Resolve namespaced names once per page instead of once per entry and field
+        properties_path = f".//{{{self.namespaces['m']}}}properties"
+        field_tags = [f"{{{self.namespaces['d']}}}{field}" for field in expected_fields]
+        meta['count'] = None
+        meta['next_skiptoken'] = None
+        root = None
         
-        for entry in root.findall('.//{http://www.w3.org/2005/Atom}entry'):
-            properties = entry.find('.//m:properties', self.namespaces)
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if root is None:
+                root = elem
+                continue
+            if event != 'end':
+                continue
             
-            if properties is not None:
-                record = {}
+            if elem.tag == entry_tag:
+                properties = elem.find(properties_path)
                 
-                # Extract all requested fields
-                for field in expected_fields:
-                    element = properties.find(f'd:{field}', self.namespaces)
-                    record[field] = element.text if element is not None else None
+                if properties is not None:
+                    # Extract all requested fields in one pass over the properties
+                    values = {child.tag: child.text for child in properties}
+                    yield tuple(values.get(tag) for tag in field_tags)
                 
-                extracted_data.append(record)
+                root.clear()
+            elif elem.tag == count_tag and elem.text:
+                meta['count'] = int(elem.text)
+            elif elem.tag == link_tag and elem.get('rel') == 'next':
+                meta['next_skiptoken'] = _raw_query_param(elem.get('href', ''), '$skiptoken')
+    
+    def _build_dataframe(self, rows: Iterable[Tuple[Optional[str], ...]], columns: List[str]) -> pd.DataFrame:
+        """Convert parsed rows (tuples in ``columns`` order) to a DataFrame"""
+        df = pd.DataFrame.from_records(list(rows), columns=columns)
         
-        if not extracted_data:
+        if df.empty:
             logger.warning("No data found in API response")
             raise Exception("No data found")
         
-        df = pd.DataFrame(extracted_data)
+        # Convert ACTUALSQTY to numeric (float32 halves the memory of large,
+        # cached extractions when SAP_FLOAT32_QUANTITIES is enabled).
+        # SAP sends well-formed decimals, so try the direct cast first; it is
+        # several times faster than to_numeric, which is kept for bad values
+        try:
+            quantities = df['ACTUALSQTY'].astype('float64')
+        except (TypeError, ValueError):
+            quantities = pd.to_numeric(df['ACTUALSQTY'], errors='coerce')
+        if self.settings.SAP_FLOAT32_QUANTITIES:
+            quantities = quantities.astype('float32')
+        df['ACTUALSQTY'] = quantities
+        
+        # Drop unparseable quantities with one mask; skip the copy when all are valid
+        valid = quantities.notna()
+        if not valid.all():
+            df = df[valid]
         
-        # Convert ACTUALSQTY to numeric
-        df['ACTUALSQTY'] = pd.to_numeric(df['ACTUALSQTY'], errors='coerce')
-        df = df.dropna(subset=['ACTUALSQTY'])
+        # Store dimension columns as categoricals: the cached frame shrinks by
+        # an order of magnitude and every later groupby works on integer codes
+        # instead of re-hashing strings (group with observed=True)
+        dimension_cols = [col for col in df.columns if col in self._AVAILABLE_ATTRIBUTE_SET]
+        if dimension_cols:
+            df = df.astype({col: 'category' for col in dimension_cols})
         
         return df
     
@@ -185,4 +497,81 @@ class SAPService:
     @classmethod
     def get_primary_key_attributes(cls) -> List[str]:
         """Get list of attributes that can be used as primary keys"""
-        return cls.PRIMARY_KEY_ATTRIBUTES
\ No newline at end of file
+        return cls.PRIMARY_KEY_ATTRIBUTES
+
+
+class CachedSAPService(SAPService):
+    """
+    SAPService that persists extraction results on disk
+    
+    Meant for development and test runs that re-pull the same data while
+    iterating on the analysis. Enabled only when SAP_CACHE_DIR is set (see
+    get_sap_service); entries expire after SAP_DISK_CACHE_TTL seconds.
+    
+    Entries are gzipped JSON (column lists plus dtypes), never pickles, so a
+    file planted in the cache directory cannot execute code when loaded.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.cache_dir = Path(self.settings.SAP_CACHE_DIR).expanduser()
+        self.cache_ttl = self.settings.SAP_DISK_CACHE_TTL
+    
+    def _cache_path(self, primary_key: str, select_fields: Tuple[str, ...], query_filter: str) -> Path:
+        """Cache file for one extraction, keyed by a hash of the request"""
+        key = json.dumps([self.api_url, primary_key, list(select_fields), query_filter])
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return self.cache_dir / f"{digest}.json.gz"
+    
+    @staticmethod
+    def _dump_frame(df: pd.DataFrame) -> bytes:
+        """Serialize a frame column-wise to gzipped JSON, keeping its dtypes"""
+        document = {
+            'columns': list(df.columns),
+            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+            'data': [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns],
+        }
+        return gzip.compress(orjson.dumps(document), compresslevel=3)
+    
+    @staticmethod
+    def _load_frame(content: bytes) -> pd.DataFrame:
+        """Rebuild a frame written by _dump_frame"""
+        document = orjson.loads(gzip.decompress(content))
+        df = pd.DataFrame(dict(zip(document['columns'], document['data'])), columns=document['columns'])
+        return df.astype(document['dtypes'])
+    
+    def _load_data(self, primary_key: str, select_fields: Tuple[str, ...], query_filter: str) -> pd.DataFrame:
+        """Return the cached extraction if fresh, otherwise fetch and store it"""
+        path = self._cache_path(primary_key, select_fields, query_filter)
+        
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime < self.cache_ttl:
+                df = self._load_frame(path.read_bytes())
+                # The file version identifies the data across loads and processes
+                df.attrs[self.EXTRACTION_ID_ATTR] = (path.name, stat.st_mtime_ns)
+                logger.info(f"Loaded {len(df)} records from disk cache {path.name}")
+                return df
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {str(e)}")
+        
+        df = super()._load_data(primary_key, select_fields, query_filter)
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write a private temp file then rename, so concurrent readers and
+            # writers (other threads or processes) never see a partial file
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False) as tmp:
+                try:
+                    tmp.write(self._dump_frame(df))
+                except BaseException:
+                    os.unlink(tmp.name)
+                    raise
+            os.replace(tmp.name, path)
+            logger.info(f"Stored {len(df)} records in disk cache {path.name}")
+        except OSError as e:
+            logger.warning(f"Failed to write disk cache {path}: {str(e)}")
+        
+        return df
@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Optional, Union
+
+
+def ttl_cache(
+    maxsize: int = 128,
+    ttl: Union[float, Callable[[], float]] = 300,
+    key: Optional[Callable[..., Any]] = None
+):
+    """
+    lru_cache-style decorator whose entries expire after ``ttl`` seconds
+
+    Args:
+        maxsize: Maximum number of entries kept (least recently used evicted first)
+        ttl: Lifetime in seconds, or a callable returning it; <= 0 disables caching
+        key: Optional function building the cache key from the call arguments
+             (defaults to the positional and keyword arguments themselves)
+
+    The wrapped function exposes ``cache_clear()``. Exceptions are never cached.
+    """
+    def decorator(func):
+        entries: OrderedDict = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            lifetime = ttl() if callable(ttl) else ttl
+            if lifetime <= 0:
+                return func(*args, **kwargs)
+
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            with lock:
+                entry = entries.get(cache_key)
+                if entry is not None and entry[0] > now:
+                    entries.move_to_end(cache_key)
+                    return entry[1]
+
+            value = func(*args, **kwargs)
+
+            with lock:
+                entries[cache_key] = (now + lifetime, value)
+                entries.move_to_end(cache_key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+
+            return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
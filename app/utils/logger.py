@@ -1,6 +1,6 @@
 import logging
 import sys
-from typing import Any
+from typing import Any, Dict
 import json
 from datetime import datetime
 
@@ -29,27 +29,47 @@ class JSONFormatter(logging.Formatter):
         return json.dumps(log_data)
 
 
+# Formatters are stateless, so one instance of each serves every handler
+_FORMATTERS: Dict[str, logging.Formatter] = {
+    "json": JSONFormatter(),
+    "text": logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+}
+
+# Numeric values of the standard level names, resolved once at import
+_LEVELS: Dict[str, int] = {
+    name: getattr(logging, name)
+    for name in ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET")
+}
+
+# Console handlers keyed by format type, shared by every configured logger
+_console_handlers: Dict[str, logging.Handler] = {}
+
+
+def _get_console_handler(format_type: str) -> logging.Handler:
+    """Return the shared stdout handler for format_type, creating it once"""
+    handler = _console_handlers.get(format_type)
+    if handler is None:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_FORMATTERS["json" if format_type == "json" else "text"])
+        _console_handlers[format_type] = handler
+    return handler
+
+
 def setup_logger(name: str, level: str = "INFO", format_type: str = "json") -> logging.Logger:
     """Setup application logger with consistent formatting"""
     logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, level.upper()))
-    
-    # Remove existing handlers
-    logger.handlers.clear()
-    
-    # Create console handler
-    handler = logging.StreamHandler(sys.stdout)
+    level_name = level.upper()
+    logger.setLevel(_LEVELS[level_name] if level_name in _LEVELS else getattr(logging, level_name))
     
-    # Set formatter
-    if format_type == "json":
-        formatter = JSONFormatter()
-    else:
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
+    # Attach the shared console handler, replacing any others; a logger that
+    # is already configured this way is left untouched
+    handler = _get_console_handler(format_type)
+    if logger.handlers != [handler]:
+        logger.handlers.clear()
+        logger.addHandler(handler)
     
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    # This logger owns the output; don't hand records on to root handlers too
+    logger.propagate = False
     
     return logger
 
@@ -0,0 +1,84 @@
+import random
+import time
+from typing import Optional
+
+import requests
+from urllib3.util.retry import Retry
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Gateway responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def idempotent_retry(total: int) -> Retry:
+    """
+    urllib3 retry policy for idempotent requests (GET/HEAD)
+
+    Mounted on an HTTPAdapter, it retries throttled and transient 5xx
+    responses with exponential backoff, honouring Retry-After. Once retries
+    are exhausted the last response is returned so raise_for_status() still
+    reports the original error.
+    """
+    return Retry(
+        total=total,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+
+def retry_after_seconds(response: requests.Response, cap: float = 30.0) -> Optional[float]:
+    """
+    Delay requested by a Retry-After header given in seconds, if any
+    
+    Clamped to ``cap`` so a long maintenance window announced by the gateway
+    cannot park a worker thread for hours; the caller's retry budget decides
+    whether to keep trying.
+    """
+    value = response.headers.get("Retry-After")
+    try:
+        return min(max(float(value), 0.0), cap) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff for the given zero-based attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def post_with_retry(
+    session: requests.Session,
+    url: str,
+    retries: int,
+    **kwargs
+) -> requests.Response:
+    """
+    POST that is re-sent on connection errors, timeouts and RETRY_STATUSES
+
+    Only use this for requests SAP accepts twice, such as non-commit batches
+    of a transaction; never for commits. The final response is returned
+    as-is, so callers still call raise_for_status().
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"POST to {url} failed ({str(e)}), retrying in {delay:.2f}s")
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            logger.warning(f"POST to {url} returned {response.status_code}, retrying in {delay:.2f}s")
+
+        time.sleep(delay)
@@ -0,0 +1,15 @@
+"""
+Shared pytest setup
+
+Settings require the SAP connection variables, so defaults pointing at a
+non-existent host are set before any app module is imported. Tests replace
+the HTTP sessions with fakes and never reach a real system.
+"""
+
+import os
+
+os.environ.setdefault("SAP_API_URL", "http://sap.test/odata/SVC/Entity")
+os.environ.setdefault("SAP_USERNAME", "user")
+os.environ.setdefault("SAP_PASSWORD", "secret")
+os.environ.setdefault("SAP_WRITE_API_URL", "http://sap.test/write")
+os.environ.setdefault("SAP_PLANNING_AREA", "SAP1")
@@ -0,0 +1,100 @@
+"""Tests for app/utils/cache.py"""
+
+import pytest
+
+from app.utils import cache
+from app.utils.cache import ttl_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable replacement for time.monotonic as seen by ttl_cache"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def counting(results):
+    """Function returning its argument and recording every real call"""
+    def func(value):
+        results.append(value)
+        return value
+    return func
+
+
+def test_entry_is_reused_until_ttl_expires(clock):
+    calls = []
+    cached = ttl_cache(ttl=10)(counting(calls))
+
+    assert cached("a") == "a"
+    clock[0] += 9.9
+    assert cached("a") == "a"
+    assert calls == ["a"]
+
+    clock[0] += 0.2
+    assert cached("a") == "a"
+    assert calls == ["a", "a"]
+
+
+def test_callable_ttl_is_read_on_every_call(clock):
+    calls = []
+    lifetime = [10]
+    cached = ttl_cache(ttl=lambda: lifetime[0])(counting(calls))
+
+    cached("a")
+    lifetime[0] = 0
+    cached("a")
+    cached("a")
+    assert calls == ["a", "a", "a"]
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    calls = []
+    cached = ttl_cache(maxsize=2, ttl=60)(counting(calls))
+
+    cached("a")
+    cached("b")
+    cached("a")  # refreshes "a", leaving "b" least recently used
+    cached("c")
+    assert calls == ["a", "b", "c"]
+
+    cached("a")
+    assert calls == ["a", "b", "c"]
+    cached("b")
+    assert calls == ["a", "b", "c", "b"]
+
+
+def test_key_function_builds_the_cache_key(clock):
+    calls = []
+    cached = ttl_cache(ttl=60, key=lambda value: value.lower())(counting(calls))
+
+    assert cached("A") == "A"
+    assert cached("a") == "A"
+    assert calls == ["A"]
+
+
+def test_exceptions_are_not_cached(clock):
+    attempts = []
+
+    @ttl_cache(ttl=60)
+    def flaky(value):
+        attempts.append(value)
+        if len(attempts) == 1:
+            raise ValueError("first call fails")
+        return value
+
+    with pytest.raises(ValueError):
+        flaky("a")
+    assert flaky("a") == "a"
+    assert flaky("a") == "a"
+    assert attempts == ["a", "a"]
+
+
+def test_cache_clear_drops_all_entries(clock):
+    calls = []
+    cached = ttl_cache(ttl=60)(counting(calls))
+
+    cached("a")
+    cached.cache_clear()
+    cached("a")
+    assert calls == ["a", "a"]
@@ -0,0 +1,224 @@
+"""Tests for the XYZ analysis in app/services/dynamic_analysis_service.py"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.models.segmentation_schemas import SegmentationConfig
+from app.services.dynamic_analysis_service import DynamicAnalysisService
+
+
+def legacy_segmentation(df, config):
+    """groupby/apply outlier removal and np.select banding the analysis replaced"""
+    attrs = config.groupby_attributes
+    if config.remove_outliers:
+        def remove_group_outliers(group):
+            if len(group) < 3:
+                return group
+            values = group['ACTUALSQTY']
+            z_scores = np.abs((values - values.mean()) / values.std(ddof=0))
+            return group[z_scores < config.outlier_threshold]
+
+        df = df.groupby(attrs, group_keys=False).apply(remove_group_outliers).reset_index(drop=True)
+
+    group_stats = df.groupby(attrs).agg({'ACTUALSQTY': ['mean', 'std', 'count']}).reset_index()
+    group_stats.columns = attrs + ['mean', 'std', 'count']
+    initial_count = len(group_stats)
+    group_stats = group_stats[group_stats['count'] >= config.min_periods].copy()
+
+    group_stats['CV'] = (group_stats['std'] / group_stats['mean']) * 100
+    group_stats['CV'] = group_stats['CV'].fillna(0)
+    group_stats['CV'] = group_stats['CV'].replace([np.inf, -np.inf], 999)
+    conditions = [
+        (group_stats['CV'] <= config.x_threshold),
+        ((group_stats['CV'] > config.x_threshold) & (group_stats['CV'] <= config.y_threshold)),
+        (group_stats['CV'] > config.y_threshold)
+    ]
+    group_stats['XYZ_Segment'] = np.select(conditions, ['X', 'Y', 'Z'], default='Unknown')
+
+    data_quality = {
+        'total_records_analyzed': len(df),
+        'unique_segments': len(group_stats),
+        'primary_key': config.primary_key,
+        'primary_key_unique_values': int(df[config.primary_key].nunique()),
+        'records_with_sufficient_history': len(group_stats),
+        'records_excluded': initial_count - len(group_stats),
+        'avg_periods_per_segment': float(group_stats['count'].mean()),
+        'min_periods_per_segment': int(group_stats['count'].min()) if len(group_stats) > 0 else 0,
+        'max_periods_per_segment': int(group_stats['count'].max()) if len(group_stats) > 0 else 0,
+        'segment_distribution': group_stats['XYZ_Segment'].value_counts().to_dict(),
+        'avg_cv_by_segment': {
+            segment: float(group_stats[group_stats['XYZ_Segment'] == segment]['CV'].mean())
+            for segment in ['X', 'Y', 'Z']
+            if segment in group_stats['XYZ_Segment'].values
+        }
+    }
+    return group_stats, data_quality
+
+
+def history(seed=7, products=40, locations=3, periods=12):
+    """Demand history with stable, erratic, spiky, flat, zero-mean and short groups"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for p in range(products):
+        for loc in range(locations):
+            count = periods if (p + loc) % 9 else 4
+            level = rng.uniform(50, 500)
+            spread = level * rng.choice([0.02, 0.15, 0.6])
+            quantities = rng.normal(level, spread, count).round(2)
+            if p % 11 == 0:
+                quantities[rng.integers(count)] *= 25
+            if p % 13 == 0:
+                quantities[:] = round(level)
+            if p % 17 == 0:
+                quantities = np.tile([-5.0, 5.0], count // 2)
+            frames.append(pd.DataFrame({
+                'PRDID': f"P{p:03d}",
+                'LOCID': f"L{loc}",
+                'PERIODID3_TSTAMP': pd.date_range('2023-01-01', periods=count, freq='MS'),
+                'ACTUALSQTY': quantities,
+            }))
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def make_config(**overrides):
+    values = dict(primary_key='PRDID', groupby_attributes=['PRDID', 'LOCID'], min_periods=6)
+    values.update(overrides)
+    return SegmentationConfig(**values)
+
+
+@pytest.mark.parametrize("remove_outliers", [False, True])
+def test_segmentation_matches_the_groupby_apply_results(remove_outliers):
+    df = history()
+    config = make_config(remove_outliers=remove_outliers, outlier_threshold=2.0)
+
+    result, quality = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+    expected, expected_quality = legacy_segmentation(df, config)
+
+    pd.testing.assert_frame_equal(result, expected)
+    # The grouped mean sums in a different order, so allow for the last ulp
+    assert quality.pop('avg_cv_by_segment') == pytest.approx(expected_quality.pop('avg_cv_by_segment'))
+    assert quality == expected_quality
+
+
+def test_outliers_are_dropped_per_group():
+    df = pd.DataFrame({
+        'PRDID': ['A'] * 8 + ['B'] * 2,
+        'ACTUALSQTY': [10, 11, 9, 10, 11, 9, 10, 100, 1, 500],
+    })
+    config = make_config(groupby_attributes=['PRDID'], remove_outliers=True, outlier_threshold=2.0)
+
+    result, quality = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+
+    # The spike is removed from A; B has too few points for a z-score and is
+    # kept whole, then excluded for its short history
+    assert result['count'].tolist() == [7]
+    assert quality['total_records_analyzed'] == 9
+    assert quality['records_excluded'] == 1
+
+
+def test_groups_without_spread_are_dropped_by_outlier_removal():
+    df = pd.DataFrame({'PRDID': ['A'] * 6 + ['B'] * 6, 'ACTUALSQTY': [5.0] * 6 + [1, 2, 3, 4, 5, 6]})
+    config = make_config(groupby_attributes=['PRDID'], remove_outliers=True)
+
+    result, _ = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+
+    # zscore of a constant group is NaN, which never passes the threshold
+    assert result['PRDID'].tolist() == ['B']
+
+
+def segments(df, config):
+    result, _ = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+    return dict(zip(result['PRDID'], result['XYZ_Segment']))
+
+
+def test_thresholds_are_inclusive_upper_bounds():
+    df = pd.DataFrame({'PRDID': ['A'] * 6, 'ACTUALSQTY': [9.0, 11.0, 10.0, 12.0, 8.0, 10.0]})
+    result, _ = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, make_config(groupby_attributes=['PRDID']))
+    cv = float(result['CV'].iloc[0])
+
+    assert segments(df, make_config(groupby_attributes=['PRDID'], x_threshold=cv, y_threshold=cv + 1)) == {'A': 'X'}
+    assert segments(df, make_config(groupby_attributes=['PRDID'], x_threshold=cv - 1e-9, y_threshold=cv)) == {'A': 'Y'}
+    assert segments(df, make_config(groupby_attributes=['PRDID'], x_threshold=cv - 2, y_threshold=cv - 1e-9)) == {'A': 'Z'}
+
+
+def test_categorical_dimensions_give_the_same_segments():
+    df = history()
+    categorical = df.copy()
+    for column in ['PRDID', 'LOCID']:
+        # Include a category with no rows, as a filtered extraction can have
+        categorical[column] = pd.Categorical(df[column], categories=sorted(df[column].unique()) + ['UNUSED'])
+    config = make_config(remove_outliers=True)
+
+    result, quality = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(categorical, config)
+    expected, expected_quality = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, config)
+
+    pd.testing.assert_frame_equal(result, expected, check_categorical=False, check_dtype=False)
+    assert quality == expected_quality
+
+
+def test_zero_mean_gets_the_cv_sentinel_only_with_spread():
+    df = pd.DataFrame({
+        'PRDID': ['SWING'] * 6 + ['ZERO'] * 6,
+        'ACTUALSQTY': [-4.0, 4.0, -2.0, 2.0, -1.0, 1.0] + [0.0] * 6,
+    })
+
+    result, _ = DynamicAnalysisService.calculate_dynamic_xyz_segmentation(df, make_config(groupby_attributes=['PRDID']))
+
+    assert result['CV'].tolist() == [999, 0]
+    assert result['XYZ_Segment'].tolist() == ['Z', 'X']
+
+
+@pytest.fixture
+def analyses(monkeypatch):
+    """Count the analyses actually run behind calculate_cached_xyz_segmentation"""
+    calls = []
+    calculate = DynamicAnalysisService.calculate_dynamic_xyz_segmentation
+
+    def counting(df, config):
+        calls.append(config.x_threshold)
+        return calculate(df, config)
+
+    DynamicAnalysisService._memoized_segmentation.cache_clear()
+    monkeypatch.setattr(DynamicAnalysisService, "calculate_dynamic_xyz_segmentation", staticmethod(counting))
+    yield calls
+    DynamicAnalysisService._memoized_segmentation.cache_clear()
+
+
+def test_memo_is_keyed_by_extraction_and_config(analyses):
+    df = history()
+    cached = DynamicAnalysisService.calculate_cached_xyz_segmentation
+
+    first, _ = cached(df, make_config(), "extract-1")
+    again, _ = cached(df, make_config(), "extract-1")
+    cached(df, make_config(x_threshold=5), "extract-1")
+    cached(df, make_config(), "extract-2")
+
+    assert analyses == [10, 5, 10]
+    pd.testing.assert_frame_equal(again, first)
+
+
+def test_unkeyed_analyses_are_not_memoized(analyses):
+    df = history()
+
+    DynamicAnalysisService.calculate_cached_xyz_segmentation(df, make_config(), None)
+    DynamicAnalysisService.calculate_cached_xyz_segmentation(df, make_config(), None)
+
+    assert analyses == [10, 10]
+
+
+def test_callers_cannot_modify_the_memoized_result(analyses):
+    df = history()
+    cached = DynamicAnalysisService.calculate_cached_xyz_segmentation
+
+    result, quality = cached(df, make_config(), "extract-1")
+    result['SEGMENT_LABEL'] = 'edited'
+    quality['segment_distribution']['X'] = -1
+    quality['avg_cv_by_segment'].clear()
+
+    again, again_quality = cached(df, make_config(), "extract-1")
+
+    assert analyses == [10]
+    assert 'SEGMENT_LABEL' not in again.columns
+    assert again_quality['segment_distribution']['X'] > 0
+    assert set(again_quality['avg_cv_by_segment']) == {'X', 'Y', 'Z'}
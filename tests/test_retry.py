@@ -0,0 +1,76 @@
+"""Tests for app/utils/retry.py"""
+
+import pytest
+import requests
+
+from app.utils import retry
+from app.utils.retry import post_with_retry, retry_after_seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """Returns scripted responses, raising the ones that are exceptions"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(retry.time, "sleep", delays.append)
+    return delays
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("2.5", 2.5),
+    ("-4", 0.0),
+    ("7200", 30.0),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", None),
+])
+def test_retry_after_is_read_in_seconds_and_capped(header, expected):
+    headers = {"Retry-After": header} if header is not None else {}
+
+    assert retry_after_seconds(FakeResponse(503, headers)) == expected
+
+
+def test_transient_responses_are_retried_until_success(sleeps):
+    session = FakeSession([FakeResponse(503, {"Retry-After": "7200"}),
+                           requests.exceptions.ConnectionError("reset"),
+                           FakeResponse(201)])
+
+    response = post_with_retry(session, "http://sap.test/write", retries=3)
+
+    assert response.status_code == 201
+    assert session.calls == 3
+    assert sleeps[0] == 30.0
+
+
+def test_last_response_is_returned_when_retries_run_out(sleeps):
+    session = FakeSession([FakeResponse(502)] * 3)
+
+    response = post_with_retry(session, "http://sap.test/write", retries=2)
+
+    assert response.status_code == 502
+    assert len(sleeps) == 2
+
+
+def test_client_errors_are_not_retried(sleeps):
+    session = FakeSession([FakeResponse(400)])
+
+    assert post_with_retry(session, "http://sap.test/write", retries=3).status_code == 400
+    assert sleeps == []
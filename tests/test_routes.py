@@ -0,0 +1,156 @@
+"""Tests for the API routes, with the SAP services replaced by fakes"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from app.api.dependencies import get_sap_service, get_sap_write_service
+from app.api.routes.dynamic_segmentation import MAX_BATCH_ANALYSES
+from app.main import app
+from app.services.sap_service import SAPService
+
+
+class FakeSAPService(SAPService):
+    """Serves a fixed demand history instead of calling SAP, counting fetches"""
+
+    def __init__(self):
+        super().__init__()
+        self.fetches = []
+
+    def fetch_data(self, primary_key='PRDID', additional_filters=None, additional_attributes=None):
+        self.fetches.append((primary_key, additional_filters))
+        rng = np.random.default_rng(len(self.fetches))
+        df = pd.DataFrame({
+            'PRDID': np.repeat([f"P{i}" for i in range(6)], 12),
+            'LOCID': np.tile(['L1', 'L2'], 36),
+            'ACTUALSQTY': rng.uniform(50, 150, 72).round(2),
+        })
+        df.attrs[self.EXTRACTION_ID_ATTR] = len(self.fetches)
+        return df
+
+
+class FakeWriteService:
+    def __init__(self):
+        self.written = []
+
+    def write_segments_simple(self, segment_data, **kwargs):
+        self.written.append(segment_data)
+        return {'transaction_id': 'T1', 'records_sent': len(segment_data), 'batch_count': 1, 'message': 'sent'}
+
+    def count_messages(self, transaction_id):
+        return {'T1': 3}.get(transaction_id, 0)
+
+
+@pytest.fixture
+def sap_service():
+    return FakeSAPService()
+
+
+@pytest.fixture
+def write_service():
+    return FakeWriteService()
+
+
+@pytest.fixture
+def client(sap_service, write_service):
+    app.dependency_overrides[get_sap_service] = lambda: sap_service
+    app.dependency_overrides[get_sap_write_service] = lambda: write_service
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_message_count(client):
+    response = client.get("/api/v1/xyz-write/status/T1/message-count")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["transaction_id"], body["message_count"], body["has_messages"]) == ("T1", 3, True)
+    assert client.get("/api/v1/xyz-write/status/T2/message-count").json()["has_messages"] is False
+
+
+def test_write_custom_sends_valid_segments(client, write_service):
+    segments = [{"PRDID": "IBP-100", "LOCID": "1720", "XYZ_Segment": "X"},
+                {"PRDID": "IBP-110", "LOCID": "1720", "XYZ_Segment": "Z"}]
+
+    response = client.post("/api/v1/xyz-write/write-custom", json={"segments": segments})
+
+    assert response.status_code == 200
+    assert response.json()["segments_written"] == {"X": 1, "Z": 1}
+    assert write_service.written[0]["PRDID"].tolist() == ["IBP-100", "IBP-110"]
+
+
+def test_write_custom_rejects_unknown_segment_values(client, write_service):
+    segments = [{"PRDID": "IBP-100", "XYZ_Segment": "X"}, {"PRDID": "IBP-110", "XYZ_Segment": "W"}]
+
+    response = client.post("/api/v1/xyz-write/write-custom", json={"segments": segments})
+
+    assert response.status_code == 400
+    assert "Invalid segment values" in response.json()["detail"]
+    assert write_service.written == []
+
+
+def test_write_custom_rejects_records_missing_required_keys(client, write_service):
+    segments = [{"PRDID": "IBP-100", "XYZ_Segment": "X"}, {"PRDID": "IBP-110"}]
+
+    response = client.post("/api/v1/xyz-write/write-custom", json={"segments": segments})
+
+    assert response.status_code == 400
+    assert "segments[1]" in response.json()["detail"]
+    assert write_service.written == []
+
+
+def test_write_custom_rejects_an_empty_segment_list(client):
+    response = client.post("/api/v1/xyz-write/write-custom", json={"segments": []})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No segments provided"
+
+
+def test_api_routes_render_with_orjson(client):
+    routes = [route for route in app.routes if isinstance(route, APIRoute)]
+
+    assert routes
+    assert all(route.response_class is ORJSONResponse for route in routes)
+    assert client.get("/health").headers["content-type"] == "application/json"
+
+
+def test_batch_analysis_shares_fetches_between_configs(client, sap_service):
+    configs = [
+        {"primary_key": "PRDID", "groupby_attributes": ["PRDID", "LOCID"]},
+        {"primary_key": "PRDID", "groupby_attributes": ["PRDID", "LOCID"], "x_threshold": 20.0},
+        {"primary_key": "LOCID", "groupby_attributes": ["LOCID"]},
+    ]
+
+    response = client.post("/api/v1/dynamic-segmentation/analyze/batch", json=configs)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["segmentation_level"] for r in results] == [["PRDID", "LOCID"], ["PRDID", "LOCID"], ["LOCID"]]
+    assert [r["unique_segments"] for r in results] == [12, 12, 2]
+    assert results[1]["analysis_params"]["x_threshold"] == 20.0
+    assert sap_service.fetches == [("PRDID", None), ("LOCID", None)]
+
+
+def test_batch_analysis_limits_the_number_of_configs(client, sap_service):
+    configs = [{"primary_key": "PRDID", "groupby_attributes": ["PRDID"]}] * (MAX_BATCH_ANALYSES + 1)
+
+    response = client.post("/api/v1/dynamic-segmentation/analyze/batch", json=configs)
+
+    assert response.status_code == 422
+    assert sap_service.fetches == []
+
+
+def test_only_large_responses_are_gzipped(client):
+    analysis = client.post(
+        "/api/v1/dynamic-segmentation/analyze",
+        json={"primary_key": "PRDID", "groupby_attributes": ["PRDID", "LOCID"]},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    health = client.get("/health", headers={"Accept-Encoding": "gzip"})
+
+    assert analysis.status_code == 200
+    assert analysis.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in health.headers
@@ -0,0 +1,203 @@
+"""Tests for the paginated read in app/services/sap_service.py"""
+
+import gzip
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+from app.services.sap_service import CachedSAPService, SAPService
+
+FIELDS = ["PRDID", "ACTUALSQTY", "PERIODID3_TSTAMP"]
+
+
+class FakeRaw:
+    """Response body stream; SAPService sets decode_content on it"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.decode_content = False
+
+    def read(self, size=-1):
+        chunk, self.body = (self.body, b"") if size is None or size < 0 else (self.body[:size], self.body[size:])
+        return chunk
+
+
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.content = body
+        self.raw = FakeRaw(body)
+        self.status_code = 200
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeODataServer:
+    """
+    Serves rows as OData v2 Atom pages through SAPService._get
+
+    Honours $top, $skip, $skiptoken and $inlinecount=allpages. With
+    server_page set, pages are truncated to that many records and end with
+    a rel="next" link carrying a $skiptoken, like a server-driven paging
+    gateway. With inline_count=False the $inlinecount option is ignored.
+    """
+
+    def __init__(self, rows, server_page=None, inline_count=True, token_prefix=""):
+        self.rows = rows
+        self.server_page = server_page
+        self.inline_count = inline_count
+        self.token_prefix = token_prefix
+        self.urls = []
+
+    @property
+    def requests(self):
+        return [parse_qs(urlparse(url).query) for url in self.urls]
+
+    def get(self, url, stream=False):
+        self.urls.append(url)
+        query = self.requests[-1]
+        token = query.get("$skiptoken", [None])[0]
+        if token is not None:
+            assert token.startswith(self.token_prefix)
+            start = int(token[len(self.token_prefix):])
+        else:
+            start = int(query.get("$skip", ["0"])[0])
+        top = int(query["$top"][0])
+        limit = min(top, self.server_page or top)
+        chunk = self.rows[start:start + limit]
+
+        parts = [
+            '<feed xmlns="http://www.w3.org/2005/Atom"'
+            ' xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata"'
+            ' xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices">'
+        ]
+        if self.inline_count and query.get("$inlinecount") == ["allpages"]:
+            parts.append(f"<m:count>{len(self.rows)}</m:count>")
+        for row in chunk:
+            props = "".join(f"<d:{field}>{value}</d:{field}>" for field, value in zip(FIELDS, row))
+            parts.append(f'<entry><content type="application/xml"><m:properties>{props}</m:properties></content></entry>')
+        end = start + len(chunk)
+        if self.server_page and limit < top and end < len(self.rows):
+            token = self.token_prefix.replace("+", "%2B").replace("&", "%26") + str(end)
+            parts.append(f'<link rel="next" href="http://sap.test/odata/SVC/Entity?$top={top}&amp;$skiptoken={token}"/>')
+        parts.append("</feed>")
+        return FakeResponse("".join(parts).encode())
+
+
+def make_rows(count):
+    return [(f"P{i:03d}", str(i + 1), f"2024-{i % 12 + 1:02d}-01T00:00:00") for i in range(count)]
+
+
+def read_all(server, **kwargs):
+    service = SAPService()
+    service._get = server.get
+    records = service.iter_records(FIELDS, "ACTUALSQTY gt 0", **kwargs)
+    return [tuple(record[field] for field in FIELDS) for record in records]
+
+
+def test_every_page_is_ordered_by_the_key_fields():
+    rows = make_rows(5)
+    server = FakeODataServer(rows)
+
+    assert read_all(server, page_size=2) == rows
+    assert len(server.requests) == 3
+    assert all(q["$orderby"] == ["PRDID,PERIODID3_TSTAMP"] for q in server.requests)
+
+
+def test_without_count_a_short_page_ends_the_read():
+    rows = make_rows(5)
+    server = FakeODataServer(rows, inline_count=False)
+
+    assert read_all(server, page_size=2) == rows
+    assert [q.get("$skip") for q in server.requests] == [None, ["2"], ["4"]]
+
+
+def test_without_count_a_full_last_page_is_followed_by_an_empty_one():
+    rows = make_rows(4)
+    server = FakeODataServer(rows, inline_count=False)
+
+    assert read_all(server, page_size=2) == rows
+    assert len(server.requests) == 3
+
+
+def test_max_records_caps_the_read():
+    rows = make_rows(5)
+    server = FakeODataServer(rows)
+
+    assert read_all(server, page_size=2, max_records=3) == rows[:3]
+    assert [q["$top"] for q in server.requests] == [["2"], ["1"]]
+
+
+def test_inline_count_stops_after_the_last_page():
+    rows = make_rows(5)
+    server = FakeODataServer(rows)
+
+    assert read_all(server, page_size=2) == rows
+    assert len(server.requests) == 3
+    assert server.requests[0]["$inlinecount"] == ["allpages"]
+    assert all("$inlinecount" not in q for q in server.requests[1:])
+
+
+def test_exact_multiple_with_count_needs_no_empty_probe():
+    rows = make_rows(4)
+    server = FakeODataServer(rows)
+
+    assert read_all(server, page_size=2) == rows
+    assert len(server.requests) == 2
+
+
+@pytest.mark.parametrize("inline_count", [True, False])
+def test_server_paging_follows_the_skiptoken(inline_count):
+    rows = make_rows(7)
+    server = FakeODataServer(rows, server_page=3, inline_count=inline_count)
+
+    assert read_all(server, page_size=10) == rows
+    assert [q.get("$skiptoken") for q in server.requests] == [None, ["3"], ["6"]]
+    assert all("$skip" not in q for q in server.requests)
+
+
+def test_skiptoken_is_sent_back_exactly_as_received():
+    rows = make_rows(5)
+    server = FakeODataServer(rows, server_page=2, token_prefix="a+b&c'")
+
+    assert read_all(server, page_size=10) == rows
+    assert server.urls[1].endswith("&$skiptoken=a%2Bb%26c'2")
+    assert server.urls[2].endswith("&$skiptoken=a%2Bb%26c'4")
+
+
+def test_disk_cache_entries_are_json_and_round_trip():
+    df = pd.DataFrame({
+        "PRDID": ["A", None, "B"],
+        "ACTUALSQTY": [1.5, 2.0, 3.25],
+        "PERIODID3_TSTAMP": ["2024-01-01T00:00:00"] * 3,
+    })
+
+    content = CachedSAPService._dump_frame(df)
+
+    assert json.loads(gzip.decompress(content))["columns"] == list(df.columns)
+    pd.testing.assert_frame_equal(CachedSAPService._load_frame(content), df)
+
+
+def test_disk_cache_serves_repeat_extractions(tmp_path, monkeypatch):
+    fetches = []
+
+    def fetch(self, primary_key, select_fields, query_filter):
+        fetches.append(select_fields)
+        return pd.DataFrame({"PRDID": ["A"], "ACTUALSQTY": [1.0], "PERIODID3_TSTAMP": ["2024-01-01"]})
+
+    monkeypatch.setattr(SAPService, "_load_data", fetch)
+    service = CachedSAPService()
+    service.cache_dir = tmp_path
+
+    first = service._load_data("PRDID", tuple(FIELDS), "ACTUALSQTY gt 0")
+    second = service._load_data("PRDID", tuple(FIELDS), "ACTUALSQTY gt 0")
+
+    assert len(fetches) == 1
+    assert [path.suffix for path in tmp_path.iterdir()] == [".gz"]
+    pd.testing.assert_frame_equal(second, first)
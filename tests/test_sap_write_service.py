@@ -0,0 +1,209 @@
+"""Tests for payload building and batched writes in app/services/sap_write_service.py"""
+
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import sap_write_service
+from app.services.sap_write_service import SAPWriteService
+
+FROZEN_NOW = datetime(2024, 5, 1, 12, 30, 0)
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return FROZEN_NOW
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(sap_write_service, "datetime", FrozenDatetime)
+    return SAPWriteService()
+
+
+def legacy_nav_records(service, segment_data, primary_key, period_field):
+    """Record-by-record payload construction the column-wise builder replaced"""
+    dimension_cols = [col for col in segment_data.columns
+                      if col not in ['XYZ_Segment', period_field, 'mean', 'std', 'CV', 'count']]
+    nav_data = []
+    for idx, row in segment_data.iterrows():
+        record = {}
+        if primary_key in row.index and pd.notna(row[primary_key]):
+            record[primary_key] = str(row[primary_key])
+        for dim in dimension_cols:
+            if dim != primary_key and dim in row.index and pd.notna(row[dim]):
+                record[dim] = str(row[dim])
+        record[service.xyz_key_figure] = str(row['XYZ_Segment'])
+        record[f"{service.xyz_key_figure}_isNull"] = False
+        if period_field in row.index and pd.notna(row[period_field]):
+            timestamp_str = str(row[period_field])
+            if 'T' not in timestamp_str:
+                timestamp_str = f"{timestamp_str}T00:00:00"
+            record[period_field] = timestamp_str
+        else:
+            record[period_field] = FROZEN_NOW.strftime("%Y-%m-%dT%H:%M:%S")
+        nav_data.append(record)
+    return nav_data
+
+
+def build_nav_records(service, segment_data, primary_key, period_field):
+    payload = service._prepare_payload(segment_data, "T1", primary_key, period_field=period_field)
+    return payload[f"Nav{service.planning_area}"]
+
+
+def test_nav_records_match_the_row_by_row_payload(service):
+    segment_data = pd.DataFrame({
+        "LOCID": ["1720", "1720", None, "1710"],
+        "PRDID": ["IBP-100", "IBP-110", "IBP-120", "IBP-130"],
+        "XYZ_Segment": ["X", "Y", "Z", "X"],
+        "PERIODID3_TSTAMP": ["2024-01-01", "2024-02-01T00:00:00", None, "2024-03-01"],
+        "CV": [5.0, 15.0, 40.0, 2.0],
+    })
+
+    assert build_nav_records(service, segment_data, "PRDID", "PERIODID3_TSTAMP") == \
+        legacy_nav_records(service, segment_data, "PRDID", "PERIODID3_TSTAMP")
+
+
+def test_nav_records_match_for_categorical_dimensions(service):
+    segment_data = pd.DataFrame({
+        "PRDID": pd.Categorical(["A", "B", "A"]),
+        "CUSTID": pd.Categorical(["C1", np.nan, "C2"]),
+        "XYZ_Segment": ["X", "Z", "Y"],
+        "PERIODID3_TSTAMP": ["2024-01-01", "2024-01-01", "2024-02-01"],
+    })
+
+    assert build_nav_records(service, segment_data, "PRDID", "PERIODID3_TSTAMP") == \
+        legacy_nav_records(service, segment_data, "PRDID", "PERIODID3_TSTAMP")
+
+
+def test_nav_records_without_period_column_use_the_current_time(service):
+    segment_data = pd.DataFrame({"PRDID": ["A", "B"], "XYZ_Segment": ["X", "Y"]})
+
+    records = build_nav_records(service, segment_data, "PRDID", "PERIODID3_TSTAMP")
+
+    assert records == legacy_nav_records(service, segment_data, "PRDID", "PERIODID3_TSTAMP")
+    assert records[0]["PERIODID3_TSTAMP"] == "2024-05-01T12:30:00"
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise sap_write_service.requests.exceptions.HTTPError(f"{self.status_code} error")
+
+
+class FakeWriteSession:
+    """Answers batch POSTs with scripted statuses (201 once the script runs out)"""
+
+    def __init__(self, statuses=(), headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers
+        self.batch_sizes = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.batch_sizes.append(len(json.loads(data)["NavSAP1"]))
+        status = self.statuses.pop(0) if self.statuses else 201
+        return FakeResponse(status, self.headers if status != 201 else None)
+
+
+@pytest.fixture
+def batched(monkeypatch, service):
+    """Run write_segments_batched against a FakeWriteSession, recording sleeps"""
+    sleeps = []
+    monkeypatch.setattr(sap_write_service.time, "sleep", sleeps.append)
+    monkeypatch.setattr(service, "_commit_transaction", lambda *args: {"status": "committed"})
+    monkeypatch.setattr(service, "_get_export_result", lambda *args: {"status": "ok"})
+
+    def run(session, records=20, batch_size=8):
+        @contextmanager
+        def csrf_session(*args, **kwargs):
+            yield session, "token"
+
+        monkeypatch.setattr(service, "csrf_session", csrf_session)
+        segment_data = pd.DataFrame({
+            "PRDID": [f"P{i:03d}" for i in range(records)],
+            "XYZ_Segment": ["X"] * records,
+            "PERIODID3_TSTAMP": ["2024-01-01"] * records,
+        })
+        return service.write_segments_batched(segment_data, batch_size=batch_size)
+
+    run.sleeps = sleeps
+    return run
+
+
+def test_batched_write_never_grows_past_batch_size(batched):
+    session = FakeWriteSession()
+
+    result = batched(session)
+
+    assert session.batch_sizes == [8, 8, 4]
+    assert result["batch_count"] == 3
+    assert result["records_sent"] == 20
+    assert batched.sleeps == []
+
+
+def test_throttled_batch_is_halved_then_grows_back(batched):
+    session = FakeWriteSession([503], headers={"Retry-After": "7200"})
+
+    result = batched(session)
+
+    # 8 throttled -> 4, then +10% (at least one record) per fast batch
+    assert session.batch_sizes == [8, 4, 5, 6, 5]
+    assert result["batch_count"] == 4
+    assert result["records_sent"] == 20
+    # Retry-After is honoured but capped
+    assert batched.sleeps == [30.0]
+
+
+def test_server_error_is_retried_at_the_same_size(batched):
+    session = FakeWriteSession([502])
+
+    result = batched(session)
+
+    assert session.batch_sizes == [8, 8, 8, 4]
+    assert result["records_sent"] == 20
+    assert len(batched.sleeps) == 1
+
+
+def test_throttling_past_max_retries_fails_the_write(batched, service):
+    service.max_retries = 2
+    session = FakeWriteSession([429] * 10)
+
+    with pytest.raises(Exception, match="Failed to send batch 1"):
+        batched(session)
+
+    assert session.batch_sizes == [8, 4, 2]
+    assert len(batched.sleeps) == 2
+
+
+class TimingOutSession(FakeWriteSession):
+    def post(self, url, data=None, headers=None, timeout=None):
+        super().post(url, data, headers, timeout)
+        raise sap_write_service.requests.exceptions.Timeout("read timed out")
+
+
+def test_timeouts_past_max_retries_report_the_error(batched, service):
+    service.max_retries = 1
+    session = TimingOutSession()
+
+    with pytest.raises(Exception, match="Failed to send batch 1: read timed out"):
+        batched(session)
+
+    assert session.batch_sizes == [8, 4]
+
+
+def test_throttling_does_not_shrink_later_writes(batched):
+    batched(FakeWriteSession([503, 503]))
+
+    session = FakeWriteSession()
+    batched(session)
+
+    assert session.batch_sizes[0] == 8